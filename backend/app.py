@@ -1,49 +1,52 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from pathlib import Path
-from openai import OpenAI
+from openai import AsyncOpenAI
+from contextlib import asynccontextmanager
+from collections import OrderedDict, deque
+from functools import partial
+from email.utils import formatdate, parsedate_to_datetime
+import asyncio
+import hashlib
+import mimetypes
+import time
 import uuid
-import zipfile
 import os
 import json
 from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, Integer, String, Text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
 from fastapi import Form
 import re
 from dotenv import load_dotenv
+from stream_parser import FilesStreamParser, recover_files
+from generation_cache import GenerationCache
+from project_store import create_store
+from postprocess import process_files
+from project_history import ProjectHistory
+from job_store import JobStore
+import metrics
 from pathlib import Path
 
 # Load environment variables from .env
 load_dotenv()
 
 # ----------------- DATABASE -----------------
-DATABASE_URL = "sqlite:///./data.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-Base = declarative_base()
+# imported after load_dotenv so DATABASE_URL / DB_THREADS from .env apply
+from database import SessionLocal, User, Task, run_db, shutdown_db_executor
 
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True)
-    password = Column(String)
-
-class Task(Base):
-    __tablename__ = "tasks"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String)
-    content = Column(Text)
-
-Base.metadata.create_all(bind=engine)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_queue.start()
+    yield
+    await job_queue.stop()
+    shutdown_db_executor()
 
 
 # Initialize app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS for frontend
 app.add_middleware(
@@ -52,38 +55,41 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# per-route latency histograms (METRICS=0 turns this into a pass-through)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# ----------------- LLM CLIENT -----------------
+# LLM_BACKEND=fake swaps in a local, network-free stand-in (see fake_llm.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 
-# Initialize client using key from environment
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-# print(f"api key:{client}")
+_llm_client = None
+
+def get_llm_client():
+    """Return the shared async chat-completions client (created lazily)."""
+    global _llm_client
+    if _llm_client is None:
+        if LLM_BACKEND == "fake":
+            from fake_llm import FakeAsyncOpenAI
+            _llm_client = FakeAsyncOpenAI()
+        else:
+            # Initialize client using key from environment
+            _llm_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _llm_client
+
+# ASSET_PIPELINE=0 skips minifying / hoisting shared CSS+JS (see postprocess.py)
+ASSET_PIPELINE = os.getenv("ASSET_PIPELINE", "1") != "0"
 
 # Directory for generated projects
 GENERATED_DIR = Path("generated_projects")
 GENERATED_DIR.mkdir(exist_ok=True)
 
-@app.post("/generate/")
-async def generate_project(request: Request):
-    """Generate a project folder with index.html + preview"""
-    try:
-        data = await request.json()
-        description = data.get("description", "").strip()
-
-        if not description:
-            return JSONResponse({"error": "Missing project description"}, status_code=400)
+# "files": pages on disk plus a zip; "archive": the zip is the only copy and
+# pages are served straight out of it
+PROJECT_STORAGE = os.getenv("PROJECT_STORAGE", "files").lower()
+project_store = create_store(PROJECT_STORAGE, GENERATED_DIR)
 
-        # Create unique folder
-        project_id = str(uuid.uuid4())[:10]
-        project_folder = GENERATED_DIR / project_id
-        project_folder.mkdir(parents=True, exist_ok=True)
-        
-        print(f"Generated pages for {project_id}:")
-        for f in project_folder.iterdir():
-            print(" -", f.name)
-        
-        
-       
-               # ---- AI Generation (JSON output enforced) ----
-        system_prompt = """
+SYSTEM_PROMPT = """
         You are an expert full-stack web developer and a code-generation assistant.
 
         Your job: produce a multi-page website as a JSON object only. STRICT RULES:
@@ -99,7 +105,9 @@ async def generate_project(request: Request):
         7) Keep JSON compact (but valid). If content contains characters that require escaping, ensure JSON remains valid.
         """
 
-        user_prompt = f"""
+
+def build_user_prompt(description: str) -> str:
+    return f"""
         Build a project based on this description: {json.dumps(description)}
 
         Return a JSON object that matches the rules above. Example shape:
@@ -112,186 +120,1346 @@ async def generate_project(request: Request):
         }}
         """
 
-        # Call the model (enforce deterministic low-temp)
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
+
+# ---- Robust JSON extraction & parsing ----
+def extract_json(s: str, call: str = "site"):
+    """
+    Try to parse JSON directly. If it fails, try the outermost {...} block and
+    finally recover every complete file object from (possibly truncated) output.
+    Returns parsed object or raises ValueError. ``call`` labels the parse metric.
+    """
+    try:
+        parsed = json.loads(s)
+        metrics.PARSES.inc(call, "direct")
+        return parsed
+    except Exception:
+        # attempt to locate a {...} block (strips markdown fences / chatter)
+        first = s.find("{")
+        last = s.rfind("}")
+        if first == -1:
+            metrics.PARSES.inc(call, "failed")
+            raise ValueError("No JSON object found in model output.")
+        if last > first:
+            try:
+                parsed = json.loads(s[first:last+1])
+                metrics.PARSES.inc(call, "outer_object")
+                return parsed
+            except Exception:
+                pass
+        # single linear pass that keeps every file object that did complete
+        files = recover_files(s[first:])
+        if files:
+            metrics.PARSES.inc(call, "recovered")
+            print(f"Recovered {len(files)} complete file(s) from malformed model output")
+            # partial site: reported as truncated and never cached
+            return {"files": files, "truncated": True}
+        metrics.PARSES.inc(call, "failed")
+        raise ValueError("Failed to extract valid JSON from model output.")
+
+
+def parse_model_output(raw: str, call: str = "site") -> dict:
+    """Parse and validate the model's JSON; raises RuntimeError on bad output."""
+    metrics.PAYLOAD_BYTES.observe(len(raw), "model_output")
+    try:
+        with metrics.span("parse"):
+            parsed = extract_json(raw, call)
+    except ValueError as e:
+        # helpful debug info in logs and return an error to client
+        print("MODEL OUTPUT (preview):", raw[:1000])
+        raise RuntimeError("Failed to parse JSON from model output: " + str(e))
+
+    # Validate structure
+    if not isinstance(parsed, dict) or "files" not in parsed or not isinstance(parsed["files"], list):
+        print("Parsed JSON doesn't contain expected 'files' array. Preview:", str(parsed)[:1000])
+        raise RuntimeError("Model output JSON must contain a 'files' array.")
+    return parsed
+
+
+def _sanitize(fileobj: dict):
+    """Return ``(rel_path, content)`` of a ``{"path", "content"}`` object, or None."""
+    if not isinstance(fileobj, dict) or "path" not in fileobj or "content" not in fileobj:
+        return None
+    rel_path = fileobj["path"].strip()
+    # sanitize path: prevent directory traversal
+    rel_path = rel_path.replace("..", "").lstrip("/")
+    if not rel_path or not isinstance(fileobj["content"], str):
+        return None
+    return rel_path, fileobj["content"]
+
+
+def prepare_files(project_id: str, parsed: dict, hoist: bool = True):
+    """Sanitize paths and run the asset pipeline (minify, hoist shared blocks,
+    inject the ``<base>`` tag so relative links work in iframe/preview).
+
+    Returns ``([(rel_path, data)], stats)``.
+    """
+    files = [entry for entry in map(_sanitize, parsed["files"]) if entry is not None]
+    with metrics.span("postprocess"):
+        return process_files(
+            files,
+            base_href=f"/generated_projects/{project_id}/",
+            hoist=hoist and ASSET_PIPELINE,
+            minify=ASSET_PIPELINE,
+        )
+
+
+def prepare_file(project_id: str, fileobj: dict):
+    """Prepare a single streamed file; returns ``(rel_path, data)`` or None."""
+    files, _ = prepare_files(project_id, {"files": [fileobj]}, hoist=False)
+    return files[0] if files else None
+
+
+def write_project(project_id: str, parsed: dict):
+    """Store the parsed files (plus index fallback and zip) for ``project_id``.
+
+    Blocking disk I/O; call it through ``asyncio.to_thread`` from async code.
+    Returns the ``(rel_path, bytes_written)`` pairs and the pipeline stats.
+    """
+    files, stats = prepare_files(project_id, parsed)
+    # "write" includes the "zip" stage the store reports on its own
+    with metrics.span("write"):
+        project_store.write_all(project_id, files)
+    metrics.PAYLOAD_BYTES.observe(stats["bytes_after"], "written")
+    print(f"Generated pages for {project_id} ({stats['bytes_saved']} bytes saved):")
+    for path, _ in files:
+        print(" -", path)
+    return [(path, len(data)) for path, data in files], stats
+
+
+def _llm_messages(description: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_user_prompt(description)},
+    ]
+
+
+async def _generate_streaming(project_id: str, description: str, publish) -> dict:
+    """Stream the completion and write each file the moment it is complete.
+
+    Returns the parsed ``{"files": [...]}`` payload, with ``"truncated": True``
+    when the model output ended before the JSON was closed.
+    """
+    started = time.perf_counter()
+    stream = await get_llm_client().chat.completions.create(
+        model=LLM_MODEL,
+        messages=_llm_messages(description),
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parser = FilesStreamParser()
+    files = []
+    received = 0
+    first_token = None
+    async for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            metrics.record_usage("stream", chunk)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter() - started
+            metrics.observe_stage("llm_first_token", first_token)
+        received += len(delta)
+        for fileobj in parser.feed(delta):
+            entry = prepare_file(project_id, fileobj)
+            if entry is not None:
+                await asyncio.to_thread(project_store.write_file, project_id, *entry)
+                files.append(fileobj)
+                publish("file", {"path": entry[0], "bytes": len(entry[1])})
+        # once the JSON is closed the rest is only drained for the usage chunk
+
+    # page writes overlap the stream, so this is model time plus those writes
+    metrics.observe_stage("llm_stream", time.perf_counter() - started)
+    metrics.PAYLOAD_BYTES.observe(received, "model_output")
+    if not files:
+        raise RuntimeError("Model output did not contain any complete file objects.")
+    parsed = {"files": files}
+    if not parser.done:
+        print(f"Model output for {project_id} was truncated; kept {len(files)} complete file(s)")
+        parsed["truncated"] = True
+    return parsed
+
+
+# ---- Parallel per-page generation ----
+# One small call settles a shared design spec, then every page is generated
+# concurrently against it, so wall-clock time tracks the slowest page rather
+# than the whole site's output tokens.
+GENERATION_MODE = os.getenv("GENERATION_MODE", "single").lower()
+PAGE_CONCURRENCY = int(os.getenv("PAGE_CONCURRENCY", "5"))
+PAGE_RETRIES = int(os.getenv("PAGE_RETRIES", "2"))
+PAGE_RETRY_BACKOFF = float(os.getenv("PAGE_RETRY_BACKOFF", "1.0"))
+REQUIRED_PAGES = ["index.html", "login.html", "signup.html", "about.html", "tasks.html"]
+MAX_PAGES = 10
+
+SPEC_SYSTEM_PROMPT = """
+        You are an expert web designer planning a multi-page website.
+
+        Output a compact shared design spec as JSON only (no markdown, no explanation) with keys:
+        "title" (site name), "palette" (object of named colors as Tailwind classes or hex),
+        "fonts" (string), "nav" (array of {"label", "href"}), "layout" (short description of the
+        header, footer and container structure every page shares) and "pages" (array of
+        {"path", "purpose"}) that includes "index.html", "login.html", "signup.html",
+        "about.html" and "tasks.html". Keep the whole spec under 300 words.
+        """
+
+PAGE_SYSTEM_PROMPT = """
+        You are an expert full-stack web developer building ONE page of a multi-page website.
+
+        STRICT RULES:
+        1) Follow the shared design spec exactly: same palette, fonts, nav and layout as every other page.
+        2) Output the complete HTML document only, starting with <!DOCTYPE html> (no markdown, no explanation).
+        3) Use TailwindCSS from CDN where appropriate.
+        4) Use relative links inside HTML (e.g., <a href="login.html">).
+        """
+
+_CODE_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+
+
+def default_spec(description: str) -> dict:
+    return {
+        "title": description[:60],
+        "nav": [{"label": p[:-5].title(), "href": p} for p in REQUIRED_PAGES],
+        "pages": [{"path": p, "purpose": ""} for p in REQUIRED_PAGES],
+    }
+
+
+def spec_pages(spec: dict) -> list:
+    """``(path, purpose)`` for every page to build: the required ones first."""
+    purposes = {}
+    for page in spec.get("pages") or []:
+        if isinstance(page, dict) and isinstance(page.get("path"), str):
+            path = page["path"].strip().replace("..", "").lstrip("/")
+            if path.endswith(".html"):
+                purposes.setdefault(path, str(page.get("purpose", "")))
+    pages = [(p, purposes.pop(p, "")) for p in REQUIRED_PAGES]
+    pages += list(purposes.items())
+    return pages[:MAX_PAGES]
+
+
+async def _complete(system_prompt: str, user_prompt: str, call: str) -> str:
+    with metrics.span("llm"):
+        completion = await get_llm_client().chat.completions.create(
+            model=LLM_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            
         )
+    metrics.record_usage(call, completion)
+    text = completion.choices[0].message.content.strip()
+    metrics.PAYLOAD_BYTES.observe(len(text), "model_output")
+    return text
+
+
+async def _with_retries(label: str, attempt_fn):
+    """Call ``attempt_fn()`` up to ``1 + PAGE_RETRIES`` times with backoff."""
+    for attempt in range(PAGE_RETRIES + 1):
+        try:
+            return await attempt_fn()
+        except Exception as e:
+            print(f"{label} attempt {attempt + 1} failed:", e)
+            if attempt == PAGE_RETRIES:
+                raise
+            await asyncio.sleep(PAGE_RETRY_BACKOFF * 2 ** attempt)
+
+
+async def generate_design_spec(description: str) -> dict:
+    async def attempt():
+        spec = extract_json(await _complete(
+            SPEC_SYSTEM_PROMPT,
+            f"Plan a website based on this description: {json.dumps(description)}",
+            call="spec",
+        ), call="spec")
+        if not isinstance(spec, dict):
+            raise ValueError("Design spec must be a JSON object.")
+        return spec
+
+    try:
+        return await _with_retries("Design spec", attempt)
+    except Exception:
+        # the pages can still be built; they just share less than they could
+        return default_spec(description)
+
+
+async def generate_page(description: str, spec_json: str, path: str, purpose: str) -> str:
+    async def attempt():
+        # the system prompt, description and spec form a prefix shared by every
+        # page, so provider-side prompt caching applies to all but the first
+        html = _CODE_FENCE.sub("", await _complete(
+            PAGE_SYSTEM_PROMPT,
+            f"Site description: {json.dumps(description)}\n"
+            f"Design spec: {spec_json}\n"
+            f"Page to build: {path}" + (f" ({purpose})" if purpose else ""),
+            call="page",
+        ))
+        if "<html" not in html.lower():
+            raise ValueError(f"Model output for {path} is not an HTML document.")
+        return html
 
+    return await _with_retries(f"Page {path}", attempt)
+
+
+async def _generate_parallel(description: str, publish) -> dict:
+    """Build the ``{"files": [...]}`` payload with one model call per page.
+
+    Pages that still fail after their retries are listed in ``"failed_pages"``
+    (and the payload marked truncated) instead of failing the whole site.
+    """
+    spec = await generate_design_spec(description)
+    spec_json = json.dumps(spec, separators=(",", ":"))
+    pages = spec_pages(spec)
+    publish("spec", {"pages": [path for path, _ in pages]})
+
+    semaphore = asyncio.Semaphore(max(1, PAGE_CONCURRENCY))
+
+    async def build(path: str, purpose: str):
+        async with semaphore:
+            html = await generate_page(description, spec_json, path, purpose)
+        publish("page", {"path": path, "bytes": len(html)})
+        return {"path": path, "content": html}
+
+    results = await asyncio.gather(
+        *(build(path, purpose) for path, purpose in pages), return_exceptions=True
+    )
+    files = []
+    failed = []
+    for (path, _), result in zip(pages, results):
+        if isinstance(result, BaseException):
+            failed.append(path)
+        else:
+            files.append(result)
+
+    if not files:
+        raise RuntimeError("Every page failed to generate.")
+    parsed = {"files": files}
+    if failed:
+        parsed["truncated"] = True
+        parsed["failed_pages"] = failed
+    return parsed
+
+
+async def generate_project_files(project_id: str, description: str,
+                                 stream: bool = False, publish=None,
+                                 mode: str = "single") -> dict:
+    """Run the model for ``description`` and write the resulting project to disk.
+
+    ``mode`` is ``"single"`` (one call for the whole site) or ``"parallel"``
+    (one call per page). Identical descriptions are served from the generation
+    cache when enabled. ``publish(event, data)`` is called with per-file
+    progress when given.
+    """
+    notify = publish or (lambda event, data: None)
+    published = set()
+
+    def publish(event: str, data: dict):
+        # streamed files are reported once, not again when the project is stored
+        if event == "file":
+            if data["path"] in published:
+                return
+            published.add(data["path"])
+        notify(event, data)
+
+    parallel = mode == "parallel"
+    stream = stream and not parallel
+
+    # ---- AI Generation (JSON output enforced) ----
+    async def produce() -> dict:
+        if parallel:
+            return await _generate_parallel(description, publish)
+        if stream:
+            return await _generate_streaming(project_id, description, publish)
+        with metrics.span("llm"):
+            completion = await get_llm_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=_llm_messages(description),
+            )
+        metrics.record_usage("site", completion)
         raw = completion.choices[0].message.content.strip()
+        return parse_model_output(raw)
+
+    if generation_cache is None:
+        parsed, source = await produce(), "miss"
+    else:
+        prompt = SPEC_SYSTEM_PROMPT + PAGE_SYSTEM_PROMPT if parallel else SYSTEM_PROMPT
+        key = GenerationCache.key(description, LLM_MODEL, prompt)
+        parsed, source = await generation_cache.fetch(key, produce)
+    metrics.annotate(cache=source)
+
+    # streamed pages are rewritten too: shared blocks are only known now
+    written, stats = await asyncio.to_thread(write_project, project_id, parsed)
+    for path, size in written:
+        publish("file", {"path": path, "bytes": size})
+
+    result = {
+        "project_id": project_id,
+        "message": "Project generated successfully",
+        "cache": source,
+        "assets": stats,
+    }
+    if parsed.get("truncated"):
+        result["truncated"] = True
+    if parsed.get("failed_pages"):
+        result["failed_pages"] = parsed["failed_pages"]
+    return result
+
+
+# ----------------- GENERATION CACHE -----------------
+# Parsed model output keyed on (normalized description, model, system prompt);
+# GENERATION_CACHE=0 disables it. The directory may be shared by all workers.
+GENERATION_CACHE_ENABLED = os.getenv("GENERATION_CACHE", "1") != "0"
+GENERATION_CACHE_DIR = Path(os.getenv("GENERATION_CACHE_DIR", "generation_cache"))
+GENERATION_CACHE_MAX_BYTES = int(os.getenv("GENERATION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+GENERATION_CACHE_MAX_AGE = float(os.getenv("GENERATION_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+
+generation_cache = (
+    GenerationCache(GENERATION_CACHE_DIR, GENERATION_CACHE_MAX_BYTES, GENERATION_CACHE_MAX_AGE)
+    if GENERATION_CACHE_ENABLED else None
+)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    if generation_cache is None:
+        return {"enabled": False}
+    usage = await asyncio.to_thread(generation_cache.disk_usage)
+    return {"enabled": True, **generation_cache.stats, **usage}
+
+
+# ----------------- JOB QUEUE -----------------
+# Generation runs in a bounded pool of background workers so a slow model call
+# never holds up the event loop (logins, previews, task APIs keep flowing).
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+GENERATION_QUEUE_SIZE = int(os.getenv("GENERATION_QUEUE_SIZE", "32"))
+# Finished jobs are kept around this long so clients can poll for the result
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+# Job status, results and events are mirrored here so every uvicorn worker can
+# answer for jobs another worker accepted (see job_store.py)
+JOB_STATE_DIR = Path(os.getenv("JOB_STATE_DIR", "job_state"))
+# how often a worker looks for cancel requests made through other workers
+JOB_CANCEL_POLL = float(os.getenv("JOB_CANCEL_POLL", "0.5"))
+job_store = JobStore(JOB_STATE_DIR)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_CANCELLING = "cancelling"  # cancel requested, the running task is unwinding
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINISHED_STATES = {JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED}
+
+
+class Job:
+    """A single queued /generate/ (or project edit) request."""
+
+    def __init__(self, description: str, stream: bool = False, mode: str = "single",
+                 project_id: str = None, edit: dict = None):
+        self.id = uuid.uuid4().hex
+        self.project_id = project_id or str(uuid.uuid4())[:10]
+        self.description = description
+        self.edit = edit  # {"instruction", "pages"} for edits of an existing project
+        self.stream = stream
+        self.mode = mode
+        self.status = JOB_QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None  # asyncio.Task while running
+        self.files = []   # paths written so far
+        self.events = []  # (event, data) log replayed to /events subscribers
+        self._wakeup = asyncio.Event()
+
+    def publish(self, event: str, data: dict):
+        if event == "file":
+            self.files.append(data["path"])
+        self.events.append((event, data))
+        job_store.append_event(self.id, event, data)
+        # wake every waiting subscriber, then arm a fresh event for the next one
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        self.status = JOB_RUNNING
+        self.started_at = time.time()
+        self.publish("status", {"status": self.status})
+        job_store.save(self.to_dict())
+
+    def finish(self, status: str, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        metrics.JOBS.inc("edit" if self.edit is not None else "generate", status)
+        metrics.annotate(status=status)
+        self.publish("done", self.to_dict())
+        job_store.save(self.to_dict())
 
-        # ---- Robust JSON extraction & parsing ----
-        def extract_json(s: str):
-            """
-            Try to parse JSON directly. If it fails, attempt to find the largest JSON object substring.
-            Returns parsed object or raises ValueError.
-            """
+    async def iter_events(self, start: int = 0):
+        """Yield ``(index, event, data)`` from ``start`` until the job is finished."""
+        i = start
+        while True:
+            wakeup = self._wakeup
+            while i < len(self.events):
+                yield (i, *self.events[i])
+                i += 1
+            if self.status in JOB_FINISHED_STATES:
+                return
+            await wakeup.wait()
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "kind": "edit" if self.edit is not None else "generate",
+            "stream": self.stream,
+            "mode": self.mode,
+            "files": list(self.files),
+        }
+        if self.status == JOB_QUEUED:
+            data["queue_position"] = job_queue.position(self)
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """Jobs accepted by this process plus a fixed pool of asyncio workers.
+
+    Jobs accepted by other worker processes are only visible through
+    ``job_store``; cancel requests for them arrive as marker files.
+    """
+
+    def __init__(self, concurrency: int, maxsize: int):
+        self.concurrency = max(1, concurrency)
+        self.maxsize = max(1, maxsize)
+        self.jobs = {}
+        self._pending = deque()
+        self._queue = None
+        self._workers = []
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        job_store.start()
+        # capacity is enforced on _pending in submit(): cancelled jobs still
+        # sitting in the queue must not count against it
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.concurrency)
+        ]
+        self._workers.append(asyncio.create_task(self._watch_shared_state()))
+
+    async def stop(self):
+        self._stopping = True
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # nobody will run these any more; don't leave them "queued" for other workers
+        for job in list(self._pending):
+            self.cancel(job)
+        await job_store.stop()
+
+    def submit(self, description: str, stream: bool = False, mode: str = "single",
+               project_id: str = None, edit: dict = None) -> Job:
+        """Enqueue a job; raises ``asyncio.QueueFull`` when at capacity."""
+        self._prune()
+        if len(self._pending) >= self.maxsize:
+            raise asyncio.QueueFull
+        job = Job(description, stream=stream, mode=mode, project_id=project_id, edit=edit)
+        self._queue.put_nowait(job)
+        self._pending.append(job)
+        self.jobs[job.id] = job
+        job_store.save(job.to_dict())
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        try:
+            return self._pending.index(job)
+        except ValueError:
+            return 0
+
+    def cancel(self, job: Job) -> bool:
+        if job.status == JOB_QUEUED:
+            # the worker drops it when it comes off the queue
+            self._discard_pending(job)
+            job.finish(JOB_CANCELLED)
+            return True
+        if job.status == JOB_RUNNING and job.task is not None:
+            job.status = JOB_CANCELLING
+            job.publish("status", {"status": job.status})
+            job.task.cancel()
+            return True
+        if job.status == JOB_CANCELLING:
+            return True
+        return False
+
+    def _discard_pending(self, job: Job):
+        try:
+            self._pending.remove(job)
+        except ValueError:
+            pass
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RESULT_TTL
+        for job_id in [
+            j.id for j in self.jobs.values()
+            if j.status in JOB_FINISHED_STATES and j.finished_at < cutoff
+        ]:
+            del self.jobs[job_id]
+
+    async def _watch_shared_state(self):
+        """Apply cancel requests made through other workers; prune old job files."""
+        last_prune = 0.0
+        while True:
+            await asyncio.sleep(JOB_CANCEL_POLL)
+            requested = await asyncio.to_thread(job_store.cancel_requests)
+            for job_id in requested:
+                job = self.jobs.get(job_id)
+                if job is not None:
+                    if job.status not in JOB_FINISHED_STATES:
+                        self.cancel(job)
+                    await asyncio.to_thread(job_store.clear_cancel, job_id)
+            if time.time() - last_prune >= 60:
+                last_prune = time.time()
+                await asyncio.to_thread(job_store.prune, JOB_RESULT_TTL)
+
+    async def _worker(self, n: int):
+        while True:
+            job = await self._queue.get()
             try:
-                return json.loads(s)
-            except Exception:
-                # attempt to locate a {...} block with balanced braces (simple heuristic)
-                # find the first '{' and last '}' and try to load progressively
-                first = s.find("{")
-                last = s.rfind("}")
-                if first == -1 or last == -1 or last <= first:
-                    raise ValueError("No JSON object found in model output.")
-                candidate = s[first:last+1]
-                # attempt incremental trimming of trailing invalid chars
-                while candidate:
+                if job.status != JOB_QUEUED:
+                    continue
+                self._discard_pending(job)
+                job.start()
+                if job.edit is not None:
+                    work = edit_project_files(job.project_id, publish=job.publish, **job.edit)
+                else:
+                    work = generate_project_files(
+                        job.project_id, job.description,
+                        stream=job.stream, publish=job.publish, mode=job.mode,
+                    )
+                # the task copies the trace context, so its spans land in it
+                with metrics.trace(
+                    "job", job_id=job.id, project_id=job.project_id,
+                    kind="edit" if job.edit is not None else "generate", mode=job.mode,
+                    queued=round(job.started_at - job.created_at, 6),
+                ):
+                    job.task = asyncio.create_task(work)
                     try:
-                        return json.loads(candidate)
-                    except Exception:
-                        # chop off a small tail and try again
-                        candidate = candidate[:-1]
-                raise ValueError("Failed to extract valid JSON from model output.")
+                        job.finish(JOB_SUCCEEDED, result=await job.task)
+                    except asyncio.CancelledError:
+                        job.finish(JOB_CANCELLED)
+                        if self._stopping:
+                            raise
+                    except Exception as e:
+                        print(f"Job {job.id} failed:", e)
+                        metrics.annotate(error=str(e))
+                        job.finish(JOB_FAILED, error=str(e))
+                    finally:
+                        job.task = None
+            finally:
+                self._queue.task_done()
+
+
+job_queue = JobQueue(GENERATION_CONCURRENCY, GENERATION_QUEUE_SIZE)
+
+
+async def json_object(request: Request):
+    """The request body if it is a JSON object, else None."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@app.post("/generate/")
+async def generate_project(request: Request):
+    """Queue generation of a project with index.html and a downloadable zip.
+
+    Returns immediately with a job id; poll ``/jobs/{job_id}`` for the result
+    or follow ``/jobs/{job_id}/events``. ``"stream": true`` writes each page as
+    soon as the model has finished it; ``"mode": "parallel"`` generates every
+    page with its own concurrent model call.
+    """
+    try:
+        data = await json_object(request)
+        if data is None:
+            return JSONResponse({"error": "Request body must be a JSON object"}, status_code=400)
+        description = str(data.get("description", "")).strip()
+        stream = data.get("stream", False)
+        if not isinstance(stream, bool):
+            return JSONResponse({"error": "stream must be true or false"}, status_code=400)
+        mode = data.get("mode", GENERATION_MODE)
+        if mode not in ("single", "parallel"):
+            return JSONResponse({"error": "mode must be 'single' or 'parallel'"}, status_code=400)
+
+        if not description:
+            return JSONResponse({"error": "Missing project description"}, status_code=400)
 
         try:
-            parsed = extract_json(raw)
-        except ValueError as e:
-            # helpful debug info in logs and return an error to client
-            print("MODEL OUTPUT (preview):", raw[:1000])
-            raise RuntimeError("Failed to parse JSON from model output: " + str(e))
-
-        # Validate structure
-        if not isinstance(parsed, dict) or "files" not in parsed or not isinstance(parsed["files"], list):
-            print("Parsed JSON doesn't contain expected 'files' array. Preview:", str(parsed)[:1000])
-            raise RuntimeError("Model output JSON must contain a 'files' array.")
-
-        # Write files to project folder
-        for fileobj in parsed["files"]:
-            if not isinstance(fileobj, dict) or "path" not in fileobj or "content" not in fileobj:
-                continue
-            rel_path = fileobj["path"].strip()
-            # sanitize path: prevent directory traversal
-            rel_path = rel_path.replace("..", "").lstrip("/")
-            target = project_folder / rel_path
-            target.parent.mkdir(parents=True, exist_ok=True)
-            content = fileobj["content"]
-            # Inject base tag into HTML files so relative links work in iframe/preview
-            if rel_path.endswith(".html"):
-                # ensure the document has <head>
-                base_tag = f'<base href="/generated_projects/{project_id}/" />'
-                if "<head" in content.lower():
-                    # replace first occurrence of <head.*?> with <head> + base_tag after tag
-                    content = re.sub(r"(?i)(<head[^>]*>)", r"\1" + base_tag, content, count=1)
-                else:
-                    # prepend head with base
-                    content = f"<head>{base_tag}</head>\n" + content
-            target.write_text(content, encoding="utf-8")
-
-        # Ensure index.html exists (fallback to first HTML file if not provided)
-        if not (project_folder / "index.html").exists():
-            # find first .html in folder
-            for p in sorted(project_folder.rglob("*.html")):
-                (project_folder / "index.html").write_text(p.read_text(), encoding="utf-8")
-                break
-
-       
-       
-    
-       
-
-        # Save index.html
-        # html_file = project_folder / "index_preview.html"
-        # html_file.write_text(html_code, encoding="utf-8")
-        index_path = project_folder / "index.html"
-        preview_path = project_folder / "index_preview.html"
-        if index_path.exists():
-            preview_path.write_text(index_path.read_text(), encoding="utf-8")
-
-        # Zip project folder
-        zip_path = GENERATED_DIR / f"{project_id}.zip"
-        with zipfile.ZipFile(zip_path, "w") as zipf:
-            for file in project_folder.rglob("*"):
-                zipf.write(file, file.relative_to(GENERATED_DIR))
-
-        return JSONResponse({
-            "project_id": project_id,
-            "message": "Project generated successfully"
-        })
+            job = job_queue.submit(description, stream=stream, mode=mode)
+        except asyncio.QueueFull:
+            return JSONResponse(
+                {"error": "Generation queue is full, try again later"},
+                status_code=429,
+                headers={"Retry-After": "30"},
+            )
+
+        return JSONResponse(job.to_dict(), status_code=202)
 
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
-    
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        # accepted by another worker process
+        snapshot = await asyncio.to_thread(job_store.load, job_id)
+        if snapshot is None:
+            return JSONResponse({"error": "Job not found"}, status_code=404)
+        return snapshot
+    return job.to_dict()
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        snapshot = await asyncio.to_thread(job_store.load, job_id)
+        if snapshot is None:
+            return JSONResponse({"error": "Job not found"}, status_code=404)
+        if snapshot["status"] in JOB_FINISHED_STATES:
+            return JSONResponse(
+                {"error": f"Job already {snapshot['status']}", **snapshot}, status_code=409
+            )
+        # the owning worker picks this up within JOB_CANCEL_POLL seconds
+        await asyncio.to_thread(job_store.request_cancel, job_id)
+        return JSONResponse({**snapshot, "status": JOB_CANCELLING}, status_code=202)
+    if not job_queue.cancel(job):
+        return JSONResponse(
+            {"error": f"Job already {job.status}", **job.to_dict()}, status_code=409
+        )
+    if job.status == JOB_CANCELLING:
+        # accepted; the job reports "cancelled" once its task has unwound
+        return JSONResponse(job.to_dict(), status_code=202)
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events feed of job progress (``status``, ``file``, ``done``)."""
+    job = job_queue.get(job_id)
+    if job is None:
+        if await asyncio.to_thread(job_store.load, job_id) is None:
+            return JSONResponse({"error": "Job not found"}, status_code=404)
+
+    # resume after the last event the browser saw when EventSource reconnects
+    try:
+        start = int(request.headers.get("last-event-id", "-1")) + 1
+    except ValueError:
+        start = 0
+
+    async def event_stream():
+        events = job.iter_events if job is not None else partial(job_store.iter_events, job_id)
+        async for i, event, data in events(max(start, 0)):
+            yield f"id: {i}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ----------------- PROJECT EDITS -----------------
+# Edits send the model only the pages being changed, write only what changed
+# (untouched zip members are copied without recompressing) and record every
+# state as a version built from content-addressed blobs for cheap rollbacks.
+PROJECT_HISTORY_DIR = Path(os.getenv("PROJECT_HISTORY_DIR", "project_history"))
+PROJECT_LOCK_TIMEOUT = float(os.getenv("PROJECT_LOCK_TIMEOUT", "600"))
+PROJECT_LOCK_POLL = 0.1
+project_history = ProjectHistory(PROJECT_HISTORY_DIR, lock_timeout=PROJECT_LOCK_TIMEOUT)
+
+EDIT_SYSTEM_PROMPT = """
+        You are an expert full-stack web developer editing an existing multi-page website.
+
+        STRICT RULES:
+        1) Output MUST be valid JSON and nothing else (no markdown, no explanation text).
+        2) The top-level JSON must be an object with a key "files": an array of
+           {"path", "content"} objects holding the COMPLETE new contents of every file you change.
+        3) Only include files you actually change (or new files you add); omit unchanged ones.
+        4) Keep the existing design, nav and relative links unless the instruction says otherwise.
+        5) Do NOT include any keys other than "files" at top-level.
+        """
+
+_BASE_TAG = re.compile(r"<base\s[^>]*>", re.I)
+
+
+@asynccontextmanager
+async def project_lock(project_id: str):
+    """Hold the project's lock file: one edit or rollback at a time, across workers."""
+    while not await asyncio.to_thread(project_history.try_lock, project_id):
+        await asyncio.sleep(PROJECT_LOCK_POLL)
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(project_history.unlock, project_id)
+
+
+def select_edit_targets(instruction: str, pages, available) -> list:
+    """Pages to send as context: the requested ones, else those the
+    instruction names (``about``, ``login``...), else every HTML page."""
+    html = sorted(p for p in available if p.endswith(".html"))
+    if pages:
+        return [p for p in dict.fromkeys(pages)]
+    words = set(re.findall(r"[a-z0-9]+", instruction.lower()))
+    if "home" in words:
+        words.add("index")
+    named = [p for p in html if p.rsplit("/", 1)[-1][:-5].lower() in words]
+    return named or html
+
+
+def build_edit_prompt(all_paths, context: list, instruction: str) -> str:
+    # project files first, instruction last: repeated edits of the same pages
+    # share a long identical prefix that provider-side prompt caching reuses
+    parts = ["Project files: " + ", ".join(sorted(all_paths))]
+    for path, content in context:
+        parts.append(f"--- {path} ---\n{content}")
+    parts.append("Instruction: " + instruction)
+    return "\n\n".join(parts)
+
+
+def _usage(completion) -> dict:
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return {}
+    data = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+    details = getattr(usage, "prompt_tokens_details", None)
+    if getattr(details, "cached_tokens", None) is not None:
+        data["cached_tokens"] = details.cached_tokens
+    return data
+
+
+async def edit_project_files(project_id: str, instruction: str, pages=None, publish=None) -> dict:
+    """Apply ``instruction`` to the given (or inferred) pages of a project."""
+    publish = publish or (lambda event, data: None)
+    async with project_lock(project_id):
+        current = await asyncio.to_thread(project_store.read_all, project_id)
+        if not current:
+            raise RuntimeError("Project not found")
+
+        targets = select_edit_targets(instruction, pages, current)
+        context = [
+            (path, _BASE_TAG.sub("", current[path].decode("utf-8", errors="replace"), count=1))
+            for path in targets if path in current
+        ]
+        with metrics.span("llm"):
+            completion = await get_llm_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": EDIT_SYSTEM_PROMPT},
+                    {"role": "user", "content": build_edit_prompt(current, context, instruction)},
+                ],
+            )
+        metrics.record_usage("edit", completion)
+        parsed = parse_model_output(completion.choices[0].message.content.strip(), "edit")
+
+        files, _ = prepare_files(project_id, parsed, hoist=False)
+        allowed = set(targets)
+        # the model only saw the target pages: never let it overwrite others blind
+        changed = [
+            (path, data) for path, data in dict(files).items()
+            if (path in allowed or path not in current) and current.get(path) != data
+        ]
+
+        def apply():
+            if not project_history.versions(project_id):
+                project_history.record(project_id, current, note="generated")
+            if changed:
+                with metrics.span("write"):
+                    project_store.update(project_id, changed)
+            return project_history.record(
+                project_id, {**current, **dict(changed)}, note=instruction
+            )
+
+        version = await asyncio.to_thread(apply)
+
+    for path, data in changed:
+        publish("file", {"path": path, "bytes": len(data)})
+    return {
+        "project_id": project_id,
+        "message": "Project updated" if changed else "No changes",
+        "version": version,
+        "changed": [path for path, _ in changed],
+        "context_pages": [path for path, _ in context],
+        "usage": _usage(completion),
+    }
+
+
+def _project_exists(project_id: str) -> bool:
+    return safe_relative_path(project_id) is not None and project_store.version(project_id) is not None
+
+
+@app.post("/projects/{project_id}/edit")
+async def edit_project(project_id: str, request: Request):
+    """Queue an edit of an existing project.
+
+    Body: ``{"instruction": str, "pages": [paths]?}``; returns a job like /generate/.
+    """
+    try:
+        data = await json_object(request)
+        if data is None:
+            return JSONResponse({"error": "Request body must be a JSON object"}, status_code=400)
+        instruction = str(data.get("instruction", "")).strip()
+        pages = data.get("pages") or None
+        if not instruction:
+            return JSONResponse({"error": "Missing edit instruction"}, status_code=400)
+        if pages is not None and (
+            not isinstance(pages, list)
+            or not all(isinstance(p, str) and safe_relative_path(p) for p in pages)
+        ):
+            return JSONResponse({"error": "pages must be a list of file paths"}, status_code=400)
+        if not await asyncio.to_thread(_project_exists, project_id):
+            return JSONResponse({"error": "Project not found"}, status_code=404)
+
+        try:
+            job = job_queue.submit(
+                instruction, project_id=project_id,
+                edit={"instruction": instruction, "pages": pages},
+            )
+        except asyncio.QueueFull:
+            return JSONResponse(
+                {"error": "Generation queue is full, try again later"},
+                status_code=429,
+                headers={"Retry-After": "30"},
+            )
+        return JSONResponse(job.to_dict(), status_code=202)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/projects/{project_id}/versions")
+async def project_versions(project_id: str):
+    if safe_relative_path(project_id) is None:
+        return JSONResponse({"error": "Project not found"}, status_code=404)
+    versions = await asyncio.to_thread(project_history.versions, project_id)
+    return [
+        {k: v for k, v in entry.items() if k != "files"} | {"files": sorted(entry["files"])}
+        for entry in versions
+    ]
+
+
+@app.post("/projects/{project_id}/rollback")
+async def rollback_project(project_id: str, request: Request):
+    """Restore ``{"version": n}``; the restored state is recorded as a new version."""
+    data = await json_object(request)
+    if data is None:
+        return JSONResponse({"error": "Request body must be a JSON object"}, status_code=400)
+    version = data.get("version")
+    if not isinstance(version, int):
+        return JSONResponse({"error": "version must be an integer"}, status_code=400)
+    if not await asyncio.to_thread(_project_exists, project_id):
+        return JSONResponse({"error": "Project not found"}, status_code=404)
+
+    async with project_lock(project_id):
+        def restore():
+            entry = project_history.get(project_id, version)
+            if entry is None:
+                return None
+            current = project_store.read_all(project_id)
+            changed, removed = project_history.diff(entry, current)
+            if changed or removed:
+                project_store.update(project_id, changed, removed)
+            new_version = project_history.record(
+                project_id,
+                {path: project_history.get_blob(d) for path, d in entry["files"].items()},
+                note=f"rollback to version {version}",
+                rollback_of=version,
+            )
+            return new_version, [p for p, _ in changed], removed
+
+        restored = await asyncio.to_thread(restore)
+    if restored is None:
+        return JSONResponse({"error": "Version not found"}, status_code=404)
+    new_version, changed, removed = restored
+    return {
+        "project_id": project_id,
+        "version": new_version,
+        "restored": version,
+        "changed": changed,
+        "removed": removed,
+    }
+
+
+# ----------------- USERS & TASKS -----------------
+# Queries are plain blocking SQLAlchemy run through run_db (database.py).
+TASK_PAGE_DEFAULT = 100
+TASK_PAGE_MAX = 500
+TASK_BULK_MAX = 1000
+
+
+class BulkTasks(BaseModel):
+    username: str
+    contents: list[str]
+
+
+class BulkDelete(BaseModel):
+    ids: list[int]
+    username: str | None = None
+
+
+def _signup(username: str, password: str) -> bool:
+    with SessionLocal() as db:
+        if db.query(User.id).filter(User.username == username).first():
+            return False
+        db.add(User(username=username, password=password))
+        try:
+            db.commit()
+        except IntegrityError:
+            # lost a race with a concurrent signup for the same name
+            db.rollback()
+            return False
+        return True
+
+
+def _login(username: str, password: str) -> bool:
+    with SessionLocal() as db:
+        user = db.query(User.id).filter(User.username == username, User.password == password).first()
+        return user is not None
+
+
+def _get_tasks(username: str, after: int, limit: int) -> list:
+    with SessionLocal() as db:
+        # keyset pagination: walks ix_tasks_username_id, no OFFSET scan
+        rows = (
+            db.query(Task.id, Task.content)
+            .filter(Task.username == username, Task.id > after)
+            .order_by(Task.id)
+            .limit(limit)
+            .all()
+        )
+        return [{"id": t.id, "content": t.content} for t in rows]
+
+
+def _add_tasks(username: str, contents: list) -> list:
+    with SessionLocal() as db:
+        tasks = [Task(username=username, content=c) for c in contents]
+        db.add_all(tasks)
+        db.commit()
+        return [t.id for t in tasks]
+
+
+def _delete_tasks(ids: list, username: str = None) -> int:
+    with SessionLocal() as db:
+        query = delete(Task).where(Task.id.in_(ids))
+        if username is not None:
+            query = query.where(Task.username == username)
+        deleted = db.execute(query).rowcount
+        db.commit()
+        return deleted
+
+
 @app.post("/api/signup")
 async def signup(username: str = Form(...), password: str = Form(...)):
-    db = SessionLocal()
-    if db.query(User).filter(User.username == username).first():
-        db.close()
+    if not await run_db(_signup, username, password):
         return {"success": False, "message": "Username already exists"}
-    new_user = User(username=username, password=password)
-    db.add(new_user)
-    db.commit()
-    db.close()
     return {"success": True, "message": "Signup successful!"}
 
 
 @app.post("/api/login")
 async def login(username: str = Form(...), password: str = Form(...)):
-    db = SessionLocal()
-    user = db.query(User).filter(User.username == username, User.password == password).first()
-    db.close()
-    if user:
+    if await run_db(_login, username, password):
         return {"success": True, "message": "Login successful!"}
     else:
         return {"success": False, "message": "Invalid credentials"}
 
 
 @app.get("/api/tasks/{username}")
-async def get_tasks(username: str):
-    db = SessionLocal()
-    tasks = db.query(Task).filter(Task.username == username).all()
-    db.close()
-    return [{"id": t.id, "content": t.content} for t in tasks]
+async def get_tasks(username: str, request: Request, after: int = 0, limit: int = TASK_PAGE_DEFAULT):
+    """Tasks of ``username`` in id order, one page at a time.
+
+    The body stays a plain list; when more tasks exist the ``X-Next-Cursor``
+    header (and a ``Link: rel="next"``) carry the ``after`` value to send next.
+    """
+    limit = max(1, min(limit, TASK_PAGE_MAX))
+    tasks = await run_db(_get_tasks, username, after, limit + 1)
+    headers = {}
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        cursor = str(tasks[-1]["id"])
+        next_url = request.url.include_query_params(after=cursor, limit=limit)
+        headers["X-Next-Cursor"] = cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return JSONResponse(tasks, headers=headers)
 
 
 @app.post("/api/tasks")
 async def add_task(username: str = Form(...), content: str = Form(...)):
-    db = SessionLocal()
-    task = Task(username=username, content=content)
-    db.add(task)
-    db.commit()
-    db.close()
+    await run_db(_add_tasks, username, [content])
     return {"success": True, "message": "Task added"}
 
 
+@app.post("/api/tasks/bulk")
+async def add_tasks_bulk(body: BulkTasks):
+    """Add many tasks for one user in a single transaction."""
+    if len(body.contents) > TASK_BULK_MAX:
+        return JSONResponse(
+            {"success": False, "message": f"At most {TASK_BULK_MAX} tasks per request"},
+            status_code=413,
+        )
+    ids = await run_db(_add_tasks, body.username, body.contents)
+    return {"success": True, "message": f"{len(ids)} tasks added", "ids": ids}
+
+
+@app.post("/api/tasks/bulk-delete")
+async def delete_tasks_bulk(body: BulkDelete):
+    """Delete many tasks by id (optionally only those owned by ``username``)."""
+    if len(body.ids) > TASK_BULK_MAX:
+        return JSONResponse(
+            {"success": False, "message": f"At most {TASK_BULK_MAX} ids per request"},
+            status_code=413,
+        )
+    deleted = await run_db(_delete_tasks, body.ids, body.username) if body.ids else 0
+    return {"success": True, "message": f"{deleted} tasks deleted", "deleted": deleted}
+
+
 @app.delete("/api/tasks/{task_id}")
 async def delete_task(task_id: int):
-    db = SessionLocal()
-    task = db.query(Task).filter(Task.id == task_id).first()
-    if task:
-        db.delete(task)
-        db.commit()
-    db.close()
+    await run_db(_delete_tasks, [task_id])
     return {"success": True, "message": "Task deleted"}
 
 
 @app.get("/download/{project_id}.zip")
 async def download_zip(project_id: str):
-    zip_path = GENERATED_DIR / f"{project_id}.zip"
-    if not zip_path.exists():
+    zip_path = project_store.zip_path(project_id)
+    try:
+        st = await asyncio.to_thread(os.stat, zip_path)
+    except OSError:
         return JSONResponse({"error": "File not found"}, status_code=404)
-    return FileResponse(zip_path, media_type="application/zip", filename=f"{project_id}.zip")
+    # FileResponse streams the archive in chunks and answers Range requests
+    return FileResponse(
+        zip_path, media_type="application/zip", filename=f"{project_id}.zip", stat_result=st
+    )
 
 
-@app.get("/generated_projects/{project_id}/{filename}")
-async def get_generated_file(project_id: str, filename: str):
-    """Serve any generated HTML or static asset from a project folder."""
-    file_path = GENERATED_DIR / project_id / filename
-    if not file_path.exists():
-        return JSONResponse({"error": "File not found"}, status_code=404)
+# ----------------- STATIC SERVING -----------------
+# Files of finished projects are served with strong validators and
+# precompressed variants, and the hottest ones are kept in memory. Projects can
+# be edited, so pages are revalidated (no-cache + ETag); only content-hashed
+# shared assets are cached as immutable.
+HOT_FILE_CACHE_BYTES = int(os.getenv("HOT_FILE_CACHE_BYTES", str(32 * 1024 * 1024)))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HASHED_ASSET = re.compile(r"assets/[0-9a-f]{12}\.(?:css|js)")
+
+MEDIA_TYPES = {
+    ".html": "text/html",
+    ".css": "text/css",
+    ".js": "application/javascript",
+}
+
+
+class ServedFile:
+    __slots__ = ("data", "variants", "etag", "last_modified", "media_type", "complete", "size",
+                 "version")
+
+    def __init__(self, data: bytes, variants: dict, mtime: float, media_type: str, complete: bool,
+                 version=None):
+        self.data = data
+        self.variants = variants
+        self.etag = '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.media_type = media_type
+        self.complete = complete
+        self.size = len(data) + sum(len(v) for v in variants.values())
+        self.version = version
+
+
+class HotFileCache:
+    """Byte-bounded LRU of ``ServedFile`` entries for finished projects."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry: ServedFile):
+        if entry.size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old.size
+        self._entries[key] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.size
+
+
+hot_files = HotFileCache(HOT_FILE_CACHE_BYTES)
+
+
+def guess_media_type(path: str) -> str:
     # Automatically set correct content type
-    if filename.endswith(".html"):
-        media_type = "text/html"
-    elif filename.endswith(".css"):
-        media_type = "text/css"
-    elif filename.endswith(".js"):
-        media_type = "application/javascript"
-    else:
-        media_type = "application/octet-stream"
-    return FileResponse(file_path, media_type=media_type)
+    for suffix, media_type in MEDIA_TYPES.items():
+        if path.endswith(suffix):
+            return media_type
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def safe_relative_path(path: str):
+    """Return ``path`` if it stays inside the project folder, else None."""
+    parts = path.split("/")
+    if not path or path.startswith("/") or any(p in ("", ".", "..") for p in parts):
+        return None
+    return path
+
+
+def load_served_file(project_id: str, path: str):
+    version = project_store.version(project_id)
+    stored = project_store.get(project_id, path)
+    if stored is None:
+        return None
+    return ServedFile(
+        stored.read(),
+        project_store.variants(project_id, path, stored),
+        stored.mtime,
+        guess_media_type(path),
+        stored.complete,
+        version,
+    )
+
+
+def pick_encoding(accept_encoding: str, available) -> str:
+    """Choose the best of ``available`` encodings the client accepts (q > 0)."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def variant_etag(etag: str, encoding) -> str:
+    """Strong validators differ per content-coding: ``"<hash>-gzip"``."""
+    return etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+
+def not_modified(request: Request, entry: ServedFile) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        # any coding of the same content is still current
+        current = {entry.etag} | {variant_etag(entry.etag, e) for e in entry.variants}
+        return "*" in tags or not tags.isdisjoint(current)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(entry.last_modified)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+@app.get("/generated_projects/{project_id}/{file_path:path}")
+async def get_generated_file(project_id: str, file_path: str, request: Request):
+    """Serve any generated HTML or static asset (nested paths allowed) from a project."""
+    file_path = safe_relative_path(file_path)
+    if file_path is None or safe_relative_path(project_id) is None:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+
+    key = (project_id, file_path)
+    entry = hot_files.get(key)
+    if entry is not None and entry.version != await asyncio.to_thread(project_store.version, project_id):
+        entry = None  # the project was edited since this copy was cached
+    if entry is None:
+        entry = await asyncio.to_thread(load_served_file, project_id, file_path)
+        if entry is None and file_path == "index_preview.html":
+            # older clients still ask for the preview copy, which is just index.html
+            entry = await asyncio.to_thread(load_served_file, project_id, "index.html")
+        if entry is None:
+            return JSONResponse({"error": "File not found"}, status_code=404)
+        if entry.complete:
+            hot_files.put(key, entry)
+
+    encoding = pick_encoding(request.headers.get("accept-encoding", ""), entry.variants)
+    headers = {
+        "ETag": variant_etag(entry.etag, encoding),
+        "Last-Modified": entry.last_modified,
+        "Cache-Control": (
+            IMMUTABLE_CACHE_CONTROL if entry.complete and HASHED_ASSET.fullmatch(file_path)
+            else "no-cache"
+        ),
+        "Vary": "Accept-Encoding",
+    }
+    if not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+
+    if encoding is None:
+        return Response(entry.data, media_type=entry.media_type, headers=headers)
+    headers["Content-Encoding"] = encoding
+    return Response(entry.variants[encoding], media_type=entry.media_type, headers=headers)
+
+
+# ----------------- METRICS -----------------
+# Prometheus text exposition of the pipeline stages, token usage, payload
+# sizes, parse fallbacks and per-route latency (see metrics.py). METRICS=0
+# disables collection and this endpoint; METRICS_JSON_LOGS=1 also prints one
+# JSON line per request and per job.
+def _job_states() -> dict:
+    counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_CANCELLING: 0}
+    for job in list(job_queue.jobs.values()):
+        if job.status in counts:
+            counts[job.status] += 1
+    return counts
+
+
+metrics.Gauge("generation_jobs", "Jobs currently queued or running.", _job_states, ("status",))
+metrics.Gauge(
+    "generation_cache_events_total", "Generation cache lookups and maintenance by outcome.",
+    lambda: dict(generation_cache.stats) if generation_cache is not None else {},
+    ("event",), kind="counter",
+)
+metrics.Gauge("hot_file_cache_bytes", "Bytes held by the in-memory served-file cache.",
+              lambda: hot_files.bytes)
+
 
+@app.get("/metrics")
+async def get_metrics():
+    if not metrics.ENABLED:
+        return JSONResponse({"error": "Metrics are disabled"}, status_code=404)
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,192 @@
+"""
+Local stand-in for the OpenAI chat-completions HTTP API.
+
+Speaks the real wire format (``POST /v1/chat/completions``, JSON or SSE with
+``stream_options.include_usage``) so the app runs unmodified against it with
+``OPENAI_BASE_URL=http://127.0.0.1:<port>/v1``. Answers come from the same
+builders as ``LLM_BACKEND=fake`` (fake_llm.py), with knobs for latency, token
+streaming, response size and malformed / truncated output:
+
+    cd backend && python benchmarks/fake_openai_server.py --port 8900 \\
+        --latency 2 --page-bytes 20000 --malformed-rate 0.1 --truncate-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse, StreamingResponse  # noqa: E402
+
+from fake_llm import fake_content  # noqa: E402
+
+FILLER = (
+    '<section class="p-4"><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, '
+    "sed do eiusmod tempor incididunt ut labore et dolore magna aliqua.</p></section>\n"
+)
+
+
+class FakeServerConfig:
+    def __init__(self, latency: float = 0.5, ttft: float = 0.0, chunk: int = 64,
+                 page_bytes: int = 0, malformed_rate: float = 0.0,
+                 truncate_rate: float = 0.0, seed: int = None):
+        self.latency = latency          # seconds for the whole answer
+        self.ttft = ttft                # extra delay before the first token
+        self.chunk = max(1, chunk)      # characters per streamed delta
+        self.page_bytes = page_bytes    # pad every page up to about this size
+        self.malformed_rate = malformed_rate
+        self.truncate_rate = truncate_rate
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "streamed": 0, "malformed": 0, "truncated": 0}
+
+
+def _pad_html(html: str, size: int) -> str:
+    missing = size - len(html)
+    if missing <= 0 or "</body>" not in html:
+        return html
+    filler = FILLER * (missing // len(FILLER) + 1)
+    return html.replace("</body>", filler[:missing] + "</body>", 1)
+
+
+def build_answer(config: FakeServerConfig, messages: list):
+    """``(content, finish_reason)`` for ``messages`` under ``config``."""
+    content = fake_content(messages)
+    if config.page_bytes:
+        try:
+            payload = json.loads(content)
+        except ValueError:
+            content = _pad_html(content, config.page_bytes)  # a single page
+        else:
+            if isinstance(payload, dict) and isinstance(payload.get("files"), list):
+                for f in payload["files"]:
+                    f["content"] = _pad_html(f["content"], config.page_bytes)
+                content = json.dumps(payload)
+
+    roll = config.random.random()
+    if roll < config.truncate_rate:
+        # cut off like a max_tokens stop, somewhere in the back half
+        config.stats["truncated"] += 1
+        cut = int(len(content) * config.random.uniform(0.5, 0.95))
+        return content[:cut], "length"
+    if roll < config.truncate_rate + config.malformed_rate:
+        # valid JSON wrapped in chatter and a markdown fence
+        config.stats["malformed"] += 1
+        return f"Sure! Here is your website:\n```json\n{content}\n```\nEnjoy!", "stop"
+    return content, "stop"
+
+
+def _usage(messages: list, content: str) -> dict:
+    prompt = sum(len(m.get("content", "")) for m in messages) // 4
+    completion = len(content) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion,
+            "total_tokens": prompt + completion}
+
+
+def create_app(config: FakeServerConfig) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/stats")
+    async def stats():
+        return config.stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        model = body.get("model", "fake")
+        content, finish_reason = build_answer(config, messages)
+        usage = _usage(messages, content)
+        completion_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        config.stats["requests"] += 1
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.ttft + config.latency)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+
+        config.stats["streamed"] += 1
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        pieces = [content[i:i + config.chunk] for i in range(0, len(content), config.chunk)]
+        delay = config.latency / max(1, len(pieces))
+
+        def event(choices, usage_value=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+            }
+            if include_usage:
+                chunk["usage"] = usage_value
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(config.ttft)
+            for n, piece in enumerate(pieces):
+                await asyncio.sleep(delay)
+                delta = {"content": piece}
+                if n == 0:
+                    delta["role"] = "assistant"
+                yield event([{"index": 0, "delta": delta, "finish_reason": None}])
+            yield event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+            if include_usage:
+                yield event([], usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", default=0.5, type=float,
+                        help="seconds per answer (spread over the deltas when streaming)")
+    parser.add_argument("--ttft", default=0.0, type=float, help="extra seconds before the first token")
+    parser.add_argument("--chunk", default=64, type=int, help="characters per streamed delta")
+    parser.add_argument("--page-bytes", default=0, type=int, help="pad each page to about this size")
+    parser.add_argument("--malformed-rate", default=0.0, type=float,
+                        help="fraction of answers wrapped in markdown and chatter")
+    parser.add_argument("--truncate-rate", default=0.0, type=float,
+                        help="fraction of answers cut off before the JSON closes")
+    parser.add_argument("--seed", default=None, type=int)
+
+
+def config_from_args(args) -> FakeServerConfig:
+    return FakeServerConfig(
+        latency=args.latency, ttft=args.ttft, chunk=args.chunk, page_bytes=args.page_bytes,
+        malformed_rate=args.malformed_rate, truncate_rate=args.truncate_rate, seed=args.seed,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8900, type=int)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port,
+                log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,503 @@
+"""
+Load test of the backend against the local fake OpenAI server.
+
+Unless ``--app-url`` points at a running deployment, it starts both servers
+itself: fake_openai_server.py, and ``uvicorn app:app`` in a scratch
+directory with its own database and ``OPENAI_BASE_URL`` aimed at the fake.
+Nothing reaches the real API or touches local data.
+
+    cd backend && python benchmarks/load_test.py --requests 40 --concurrency 8 \\
+        --latency 1 --json results/baseline.json
+    python benchmarks/load_test.py --requests 40 --concurrency 8 --latency 1 \\
+        --json results/new.json --compare results/baseline.json
+
+Scenarios:
+- ``generate``: POST /generate/, then poll the job until it finishes.
+- ``preview``: GET /generated_projects/...
+- ``download``: GET /download/<id>.zip
+- ``tasks_add`` and ``tasks_list``: the task APIs.
+
+Each scenario reports p50/p95/p99 latency, throughput, errors and the
+server's resident memory. Results are saved as JSON and compared scenario by
+scenario against an earlier run.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+from fake_openai_server import add_arguments as add_fake_arguments
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ["generate", "preview", "download", "tasks_add", "tasks_list"]
+OK_STATUSES = {"succeeded"}
+
+
+# ---- measurement ----
+def percentile(sorted_values: list, q: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _rss_kb(pid: int) -> int:
+    """Resident memory of ``pid`` and all its descendants (Linux /proc)."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(c) for c in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class RssSampler:
+    """Samples the server's RSS in the background while a scenario runs."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, await asyncio.to_thread(_rss_kb, self.pid))
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        if self.pid:
+            self.peak = 0
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        if self._task is not None:
+            self._task.cancel()
+        return False
+
+    def result(self) -> dict:
+        if not self.pid:
+            return {}
+        end = _rss_kb(self.pid)
+        return {"rss_peak_mb": round(max(self.peak, end) / 1024, 1), "rss_end_mb": round(end / 1024, 1)}
+
+
+async def run_scenario(name: str, requests: int, concurrency: int, op, pid: int = None) -> dict:
+    """Run ``op(i)`` for ``i in range(requests)`` with ``concurrency`` in flight.
+
+    ``op`` returns an HTTP status code or a job status; anything but 2xx/3xx
+    or ``"succeeded"`` counts as an error.
+    """
+    latencies = []
+    statuses = Counter()
+    counter = itertools.count()
+
+    async def worker():
+        for i in counter:
+            if i >= requests:
+                return
+            start = time.perf_counter()
+            try:
+                status = await op(i)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[str(status)] += 1
+
+    with RssSampler(pid) as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        wall = time.perf_counter() - start
+
+    latencies.sort()
+    errors = sum(
+        count for status, count in statuses.items()
+        if status not in OK_STATUSES and not (status.isdigit() and 200 <= int(status) < 400)
+    )
+    ms = lambda v: round(v * 1000, 2) if v is not None else None  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": dict(statuses),
+        "seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else None,
+        **rss.result(),
+    }
+
+
+# ---- scenarios ----
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, args, pid: int = None):
+        self.client = client
+        self.args = args
+        self.pid = pid
+        self.run_id = uuid.uuid4().hex[:8]
+        self.projects = []
+        self.users = []
+        self.job_outcomes = Counter()
+
+    async def generate_one(self, i: int, measured: bool = True):
+        body = {
+            "description": f"{self.args.description} (load test {self.run_id}-{i})",
+            "stream": self.args.stream,
+            "mode": self.args.mode,
+        }
+        while True:
+            r = await self.client.post("/generate/", json=body)
+            if r.status_code != 429:
+                break
+            # queue full: back off briefly rather than for the full Retry-After
+            if measured:
+                self.job_outcomes["rejected_429"] += 1
+            await asyncio.sleep(self.args.retry_interval)
+        if r.status_code != 202:
+            return r.status_code
+        job_id = r.json()["job_id"]
+        while True:
+            await asyncio.sleep(self.args.poll_interval)
+            job = (await self.client.get(f"/jobs/{job_id}")).json()
+            if job["status"] in ("succeeded", "failed", "cancelled"):
+                break
+        if job["status"] == "succeeded":
+            # truncated sites may lack pages; only fetch the ones that exist
+            pages = [p for p in job.get("files", []) if p.endswith(".html")] or ["index.html"]
+            self.projects.append((job["project_id"], pages))
+            result = job.get("result") or {}
+            if measured and result.get("truncated"):
+                self.job_outcomes["truncated"] += 1
+            if measured and result.get("failed_pages"):
+                self.job_outcomes["failed_pages"] += len(result["failed_pages"])
+        return job["status"]
+
+    async def ensure_projects(self):
+        # preview / download without a generate run still need something to fetch
+        missing = self.args.seed_projects - len(self.projects)
+        if missing > 0:
+            await asyncio.gather(*(
+                self.generate_one(f"seed-{n}", measured=False) for n in range(missing)
+            ))
+        if not self.projects:
+            raise SystemExit("No project could be generated; is the app healthy?")
+
+    async def preview_one(self, i: int):
+        project_id, pages = self.projects[i % len(self.projects)]
+        page = pages[i // len(self.projects) % len(pages)]
+        r = await self.client.get(
+            f"/generated_projects/{project_id}/{page}",
+            headers={"Accept-Encoding": "gzip, br"},
+        )
+        return r.status_code
+
+    async def download_one(self, i: int):
+        project_id, _ = self.projects[i % len(self.projects)]
+        r = await self.client.get(f"/download/{project_id}.zip")
+        return r.status_code
+
+    async def ensure_users(self):
+        if self.users:
+            return
+        for n in range(self.args.users):
+            username = f"load-{self.run_id}-{n}"
+            r = await self.client.post("/api/signup", data={"username": username, "password": "pw"})
+            if r.status_code >= 400:
+                raise SystemExit(f"Signup failed: {r.status_code} {r.text[:200]}")
+            self.users.append(username)
+
+    async def tasks_add_one(self, i: int):
+        r = await self.client.post(
+            "/api/tasks",
+            data={"username": self.users[i % len(self.users)], "content": f"task {i}"},
+        )
+        return r.status_code
+
+    async def tasks_list_one(self, i: int):
+        r = await self.client.get(f"/api/tasks/{self.users[i % len(self.users)]}?limit=100")
+        return r.status_code
+
+    async def run(self, scenarios: list) -> dict:
+        args = self.args
+        results = {}
+        for name in scenarios:
+            if name == "generate":
+                op = self.generate_one
+            elif name in ("preview", "download"):
+                await self.ensure_projects()
+                op = self.preview_one if name == "preview" else self.download_one
+            else:
+                await self.ensure_users()
+                op = self.tasks_add_one if name == "tasks_add" else self.tasks_list_one
+            requests = args.generations if name == "generate" else args.requests
+            concurrency = args.generate_concurrency if name == "generate" else args.concurrency
+            print(f"running {name}: {requests} requests, concurrency {concurrency}", flush=True)
+            results[name] = await run_scenario(name, requests, concurrency, op, self.pid)
+            if name == "generate":
+                results[name].update(self.job_outcomes)
+        return results
+
+    async def server_metrics(self) -> dict:
+        """Mean seconds per pipeline stage and parse outcomes from /metrics."""
+        try:
+            r = await self.client.get("/metrics")
+        except httpx.HTTPError:
+            return {}
+        if r.status_code != 200:
+            return {}
+        sums, counts, parses = {}, {}, {}
+        for line in r.text.splitlines():
+            if line.startswith("generation_stage_seconds_sum{"):
+                sums[line.split('"')[1]] = float(line.rsplit(" ", 1)[1])
+            elif line.startswith("generation_stage_seconds_count{"):
+                counts[line.split('"')[1]] = float(line.rsplit(" ", 1)[1])
+            elif line.startswith("model_output_parses_total{"):
+                labels = line.split('"')
+                parses[f"{labels[1]}:{labels[3]}"] = int(float(line.rsplit(" ", 1)[1]))
+        return {
+            "stage_mean_ms": {
+                stage: round(1000 * sums[stage] / counts[stage], 2)
+                for stage in sorted(sums) if counts.get(stage)
+            },
+            "parses": parses,
+        }
+
+
+# ---- servers ----
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{url} exited during startup (code {proc.returncode})")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_servers(args, workdir: Path):
+    """Start the fake OpenAI server and the app; returns ``(procs, app_url)``."""
+    fake_port, app_port = free_port(), free_port()
+    fake_cmd = [
+        sys.executable, str(BACKEND / "benchmarks" / "fake_openai_server.py"),
+        "--port", str(fake_port),
+        "--latency", str(args.latency), "--ttft", str(args.ttft), "--chunk", str(args.chunk),
+        "--page-bytes", str(args.page_bytes),
+        "--malformed-rate", str(args.malformed_rate), "--truncate-rate", str(args.truncate_rate),
+    ]
+    if args.seed is not None:
+        fake_cmd += ["--seed", str(args.seed)]
+
+    env = {
+        **os.environ,
+        "LLM_BACKEND": "openai",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "OPENAI_API_KEY": "load-test",
+        "DATABASE_URL": f"sqlite:///{workdir / 'load_test.db'}",
+        "GENERATION_CACHE": "1" if args.cache else "0",
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    log = open(workdir / "servers.log", "w")
+    procs = [subprocess.Popen(fake_cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)]
+    wait_ready(f"http://127.0.0.1:{fake_port}/stats", procs[0])
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--app-dir", str(BACKEND),
+         "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    ))
+    app_url = f"http://127.0.0.1:{app_port}"
+    wait_ready(f"{app_url}/cache/stats", procs[1])
+    return procs, app_url
+
+
+def stop_servers(procs: list):
+    for proc in reversed(procs):
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# ---- reporting ----
+COMPARED = [("p50_ms", 1), ("p95_ms", 1), ("p99_ms", 1), ("throughput_rps", -1), ("rss_peak_mb", 1)]
+
+
+def print_results(results: dict):
+    header = f"{'scenario':<12}{'reqs':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(
+            f"{name:<12}{r['requests']:>6}{r['errors']:>5}{r['p50_ms'] or 0:>10}"
+            f"{r['p95_ms'] or 0:>10}{r['p99_ms'] or 0:>10}{r['throughput_rps'] or 0:>9}"
+            f"{r.get('rss_peak_mb', '-'):>9}"
+        )
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print the change per scenario and metric; return the regressions."""
+    regressions = []
+    print(f"\ncompared with {baseline['meta'].get('timestamp')} ({baseline['meta'].get('git_commit')}):")
+    for name, r in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        changes = []
+        for metric, direction in COMPARED:
+            before, after = old.get(metric), r.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            flag = ""
+            if change * direction > threshold:
+                flag = " !"
+                regressions.append(f"{name}.{metric}")
+            changes.append(f"{metric} {before} -> {after} ({change:+.0%}){flag}")
+        print(f"  {name}: " + "; ".join(changes))
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_async(args) -> dict:
+    procs = []
+    pid = args.server_pid
+    workdir = None
+    if args.app_url:
+        app_url = args.app_url.rstrip("/")
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="load_test_"))
+        procs, app_url = start_servers(args, workdir)
+        pid = procs[1].pid
+        print(f"app on {app_url} (pid {pid}), scratch dir {workdir}", flush=True)
+
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency, args.generate_concurrency) + 8)
+        async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+            test = LoadTest(client, args, pid)
+            results = await test.run(args.scenarios)
+            server = await test.server_metrics()
+    finally:
+        stop_servers(procs)
+        if workdir is not None and not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    options = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": options,
+        },
+        "results": results,
+        "server": server,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--app-url", help="test a running app instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="with --app-url: pid whose RSS to sample")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda s: [x for x in s.split(",") if x])
+    parser.add_argument("--requests", default=200, type=int, help="requests per serving/task scenario")
+    parser.add_argument("--concurrency", default=16, type=int)
+    parser.add_argument("--generations", default=20, type=int, help="jobs in the generate scenario")
+    parser.add_argument("--generate-concurrency", default=8, type=int)
+    parser.add_argument("--description", default="a todo app with login and a tasks page")
+    parser.add_argument("--mode", default="single", choices=["single", "parallel"])
+    parser.add_argument("--stream", action="store_true", help="generate with stream=true")
+    parser.add_argument("--cache", action="store_true", help="keep the generation cache on")
+    parser.add_argument("--seed-projects", default=5, type=int,
+                        help="projects to generate first when preview/download run alone")
+    parser.add_argument("--users", default=10, type=int)
+    parser.add_argument("--workers", default=1, type=int, help="uvicorn workers for the started app")
+    parser.add_argument("--keep-workdir", action="store_true",
+                        help="keep the started app's scratch dir (projects, database, servers.log)")
+    parser.add_argument("--env", action="append", default=[],
+                        help="KEY=VALUE for the started app (e.g. PROJECT_STORAGE=archive)")
+    parser.add_argument("--poll-interval", default=0.05, type=float)
+    parser.add_argument("--retry-interval", default=0.25, type=float)
+    parser.add_argument("--timeout", default=120.0, type=float)
+    add_fake_arguments(parser)
+    parser.add_argument("--json", type=Path, help="write the results here")
+    parser.add_argument("--compare", type=Path, help="earlier --json results to compare against")
+    parser.add_argument("--threshold", default=0.2, type=float,
+                        help="relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(main_async(args))
+    print()
+    print_results(report["results"])
+    if report["server"].get("stage_mean_ms"):
+        print("\nserver stage means (ms):", report["server"]["stage_mean_ms"])
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.compare:
+        regressions = compare(report["results"], json.loads(args.compare.read_text()), args.threshold)
+        if regressions:
+            print("regressions:", ", ".join(regressions))
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Throughput of the asset pipeline (postprocess.py) over stored projects.
+
+Every project under ``--dir`` (folders, or bare ``<id>.zip`` archives in
+archive storage mode) is loaded once, its injected ``<base>`` tags removed,
+and then run through ``process_files`` ``--iterations`` times.
+
+    cd backend && python benchmarks/postprocess_bench.py --dir generated_projects
+"""
+import argparse
+import json
+import re
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from postprocess import process_files  # noqa: E402
+
+TEXT_SUFFIXES = (".html", ".css", ".js")
+_BASE_TAG = re.compile(r"<base\s[^>]*>", re.I)
+
+
+def _source(path: str, text: str) -> str:
+    return _BASE_TAG.sub("", text, count=1) if path.endswith(".html") else text
+
+
+def load_corpus(root: Path) -> dict:
+    """``{project_id: [(rel_path, content)]}`` for every stored project."""
+    corpus = {}
+    for folder in sorted(p for p in root.iterdir() if p.is_dir()):
+        files = [
+            (f.relative_to(folder).as_posix(), f.read_text(encoding="utf-8", errors="replace"))
+            for f in sorted(folder.rglob("*"))
+            if f.is_file() and f.name.endswith(TEXT_SUFFIXES) and f.name != "index_preview.html"
+        ]
+        if files:
+            corpus[folder.name] = [(p, _source(p, t)) for p, t in files]
+    for archive in sorted(root.glob("*.zip")):
+        project_id = archive.stem
+        if project_id in corpus:
+            continue
+        with zipfile.ZipFile(archive) as zf:
+            prefix = f"{project_id}/"
+            files = [
+                (name[len(prefix):], zf.read(name).decode("utf-8", errors="replace"))
+                for name in sorted(zf.namelist())
+                if name.startswith(prefix) and name.endswith(TEXT_SUFFIXES)
+                and not name.endswith("/index_preview.html")
+            ]
+        if files:
+            corpus[project_id] = [(p, _source(p, t)) for p, t in files]
+    return corpus
+
+
+def run(corpus: dict, iterations: int) -> dict:
+    pages = sum(len(files) for files in corpus.values())
+    totals = {"bytes_before": 0, "bytes_after": 0, "bytes_saved": 0, "shared_assets": 0}
+    for project_id, files in corpus.items():
+        _, stats = process_files(files, base_href=f"/generated_projects/{project_id}/")
+        for key in totals:
+            totals[key] += stats[key]
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for project_id, files in corpus.items():
+            process_files(files, base_href=f"/generated_projects/{project_id}/")
+    elapsed = time.perf_counter() - start
+
+    runs = iterations * len(corpus)
+    return {
+        "projects": len(corpus),
+        "pages": pages,
+        "iterations": iterations,
+        "seconds": round(elapsed, 4),
+        "projects_per_s": round(runs / elapsed, 1) if elapsed else None,
+        "mb_per_s": round(totals["bytes_before"] * iterations / elapsed / 1e6, 2) if elapsed else None,
+        **totals,
+        "saved_pct": round(100 * totals["bytes_saved"] / totals["bytes_before"], 1)
+        if totals["bytes_before"] else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dir", default="generated_projects", type=Path)
+    parser.add_argument("--iterations", default=50, type=int)
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.dir)
+    if not corpus:
+        sys.exit(f"No generated projects found under {args.dir}")
+    result = run(corpus, args.iterations)
+    for key, value in result.items():
+        print(f"{key:>16}: {value}")
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
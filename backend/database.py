@@ -0,0 +1,151 @@
+"""
+Persistence for users and tasks.
+
+SQLAlchemy stays synchronous; every query runs on a small dedicated thread
+pool through ``run_db`` so handlers never block the event loop. SQLite runs in
+WAL mode (readers don't wait for the writer) and the connection pool is sized
+to that thread pool. Schema changes for existing databases are applied as
+numbered migrations on startup.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event, inspect, text, Column, Index, Integer, String, Text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data.db")
+# threads (and pooled connections) dedicated to database work
+DB_THREADS = int(os.getenv("DB_THREADS", "8"))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+engine = create_engine(
+    DATABASE_URL,
+    # "timeout" is SQLite's busy timeout: how long to wait for another writer
+    connect_args={"check_same_thread": False, "timeout": 30} if IS_SQLITE else {},
+    pool_size=DB_THREADS,
+    max_overflow=0,
+    pool_timeout=30,
+    pool_pre_ping=not IS_SQLITE,
+)
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")    # durable enough with WAL
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA cache_size=-16000")     # ~16 MB page cache
+        cur.execute("PRAGMA mmap_size=134217728")
+        cur.close()
+
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, index=True)
+    password = Column(String)
+
+
+class Task(Base):
+    __tablename__ = "tasks"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String)
+    content = Column(Text)
+
+    # serves both "tasks of a user" and keyset pagination by id
+    __table_args__ = (Index("ix_tasks_username_id", "username", "id"),)
+
+
+def _username_has_unique_constraint(conn) -> bool:
+    # databases created before username was indexed carry UNIQUE (username),
+    # whose automatic index already serves lookups
+    return any(
+        uc["column_names"] == ["username"] for uc in inspect(conn).get_unique_constraints("users")
+    )
+
+
+def _unique_username_index(conn):
+    if not _username_has_unique_constraint(conn):
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)"))
+
+
+def _drop_redundant_username_index(conn):
+    # added by an earlier version of migration 2 next to the UNIQUE constraint
+    if _username_has_unique_constraint(conn):
+        conn.execute(text("DROP INDEX IF EXISTS ix_users_username"))
+
+
+# Applied in order to databases created before the change existed; each one
+# is idempotent so a fresh create_all() schema passes through unchanged.
+# Entries are SQL statements or callables taking the connection.
+MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS ix_tasks_username_id ON tasks (username, id)",
+    _unique_username_index,
+    _drop_redundant_username_index,
+]
+
+
+def migrate():
+    """Create the schema and apply pending migrations.
+
+    Every uvicorn worker runs this on import, so it happens under a database
+    write lock and the applied version is read only once that lock is held.
+    """
+    with engine.connect() as conn:
+        if IS_SQLITE:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        elif engine.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(74021)"))
+        Base.metadata.create_all(bind=conn)
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)"
+        ))
+        current = conn.execute(
+            text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        ).scalar()
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            if version <= current:
+                continue
+            if callable(migration):
+                migration(conn)
+            else:
+                conn.execute(text(migration))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version) VALUES (:v)"), {"v": version}
+            )
+        conn.commit()
+
+
+migrate()
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+_db_executor = None
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Return the DB thread pool, created on first use (and again after a shutdown)."""
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+    return _db_executor
+
+
+def shutdown_db_executor():
+    global _db_executor
+    executor, _db_executor = _db_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run blocking database code ``fn(*args, **kwargs)`` on the DB thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,179 @@
+"""
+Local stand-in for the OpenAI chat-completions client.
+
+Enable with ``LLM_BACKEND=fake``. It returns a small but complete multi-page
+site in the same JSON shape the real model is asked for, after an artificial
+delay, so the generation pipeline can be exercised without network access.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from types import SimpleNamespace
+
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+# characters per streamed delta when called with stream=True
+FAKE_LLM_CHUNK = int(os.getenv("FAKE_LLM_CHUNK", "64"))
+
+PAGES = ["index.html", "login.html", "signup.html", "about.html", "tasks.html"]
+
+
+# the same inline setup the real model repeats on every page
+SHARED_HEAD = """
+    <script>
+      tailwind.config = {
+        theme: { extend: { colors: { brand: '#4f46e5' } } }
+      }
+    </script>
+    <style>
+      /* shared layout */
+      body { font-family: Inter, sans-serif; }
+      nav a { margin-right: 1rem; color: #4f46e5; }
+    </style>
+"""
+
+
+def _page(title: str, description: str) -> str:
+    nav = " | ".join(f'<a href="{p}">{p[:-5].title()}</a>' for p in PAGES)
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\" />"
+        f"<title>{title}</title>"
+        '<script src="https://cdn.tailwindcss.com"></script>'
+        f"{SHARED_HEAD}</head>"
+        f'<body class="p-8"><nav class="mb-4">{nav}</nav>'
+        f'<h1 class="text-2xl font-bold">{title}</h1>'
+        f"<p>{description}</p></body></html>"
+    )
+
+
+def fake_site(description: str) -> dict:
+    """Build the ``{"files": [...]}`` payload for ``description``."""
+    return {
+        "files": [
+            {"path": p, "content": _page(p[:-5].title(), description)}
+            for p in PAGES
+        ]
+    }
+
+
+def fake_spec(description: str) -> dict:
+    return {
+        "title": description[:60],
+        "palette": {"primary": "bg-indigo-600", "text": "text-gray-900"},
+        "fonts": "Inter, sans-serif",
+        "nav": [{"label": p[:-5].title(), "href": p} for p in PAGES],
+        "layout": "top nav, centered container, simple footer",
+        "pages": [{"path": p, "purpose": f"{p[:-5]} page"} for p in PAGES],
+    }
+
+
+def fake_edit(user: str) -> dict:
+    """Apply an edit prompt: append the instruction to every page it was given."""
+    instruction = user.rsplit("Instruction: ", 1)[-1].strip()
+    files = []
+    for section in user.split("\n\n--- ")[1:]:
+        header, _, content = section.partition("\n")
+        path = header.rstrip(" -")
+        content = content.split("\n\nInstruction: ", 1)[0]
+        files.append({
+            "path": path,
+            "content": content.replace("</body>", f"<p>{instruction}</p></body>", 1),
+        })
+    return {"files": files}
+
+
+def fake_content(messages) -> str:
+    """Answer a site, design-spec, single-page or edit prompt the way the model would."""
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    if user.startswith("Project files: "):
+        return json.dumps(fake_edit(user))
+    description = _description_from(messages)
+    if "Page to build: " in user:
+        path = user.split("Page to build: ", 1)[1].split()[0]
+        return _page(path.rsplit(".", 1)[0].title(), description)
+    if user.startswith("Plan a website"):
+        return json.dumps(fake_spec(description))
+    return json.dumps(fake_site(description))
+
+
+def _description_from(messages) -> str:
+    for m in reversed(messages):
+        if m.get("role") == "user":
+            text = m.get("content", "")
+            marker = "description: "
+            if marker in text:
+                line = text.split(marker, 1)[1].splitlines()[0]
+                try:
+                    return json.loads(line)
+                except ValueError:
+                    return line
+            return text.strip()
+    return ""
+
+
+def _usage(messages, content: str):
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+    completion_tokens = len(content) // 4
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+class _Completions:
+    def __init__(self, latency: float, chunk_size: int):
+        self.latency = latency
+        self.chunk_size = max(1, chunk_size)
+
+    async def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        content = fake_content(messages)
+        usage = _usage(messages, content)
+        if stream:
+            include_usage = (kwargs.get("stream_options") or {}).get("include_usage", False)
+            return self._stream(model, content, usage if include_usage else None)
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            id=f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+            created=int(time.time()),
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                finish_reason="stop",
+                message=SimpleNamespace(role="assistant", content=content),
+            )],
+            usage=usage,
+        )
+
+    async def _stream(self, model: str, content: str, usage=None):
+        """Yield ``chat.completion.chunk``-shaped deltas spread over ``latency``."""
+        pieces = [
+            content[i:i + self.chunk_size]
+            for i in range(0, len(content), self.chunk_size)
+        ]
+        delay = self.latency / max(1, len(pieces))
+        chunk_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        for n, piece in enumerate(pieces):
+            await asyncio.sleep(delay)
+            last = n == len(pieces) - 1
+            yield SimpleNamespace(
+                id=chunk_id,
+                model=model,
+                choices=[SimpleNamespace(
+                    index=0,
+                    finish_reason="stop" if last else None,
+                    delta=SimpleNamespace(role="assistant", content=piece),
+                )],
+                usage=None,
+            )
+        if usage is not None:
+            # stream_options={"include_usage": True}: a final chunk with no choices
+            yield SimpleNamespace(id=chunk_id, model=model, choices=[], usage=usage)
+
+
+class FakeAsyncOpenAI:
+    """Mimics the ``client.chat.completions.create`` surface of ``AsyncOpenAI``."""
+
+    def __init__(self, latency: float = FAKE_LLM_LATENCY, chunk_size: int = FAKE_LLM_CHUNK):
+        self.chat = SimpleNamespace(completions=_Completions(latency, chunk_size))
@@ -0,0 +1,48 @@
+"""
+Filesystem primitives shared by the stores that every uvicorn worker writes
+to at once (generation cache, job state, project history, project archives).
+
+* ``temp_path`` / ``write_atomic``: build a file next to its target under a
+  name unique to this process and thread, then ``os.replace`` it into place,
+  so readers see the old file or the new one, never half of either.
+* ``try_lock`` / ``unlock``: an ``O_EXCL`` lock file holding the owner's pid;
+  a lock older than ``timeout`` seconds belongs to a dead worker and is broken.
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def temp_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def write_atomic(path: Path, data: bytes):
+    tmp = temp_path(path)
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def try_lock(path: Path, timeout: float) -> bool:
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - path.stat().st_mtime <= timeout:
+                return False
+            # the owner died while holding it; break the lock
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        return try_lock(path, timeout)
+    with os.fdopen(fd, "w") as f:
+        f.write(str(os.getpid()))
+    return True
+
+
+def unlock(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
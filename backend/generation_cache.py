@@ -0,0 +1,208 @@
+"""
+Content-addressed cache of parsed model output (the ``{"files": [...]}`` payload).
+
+Entries are keyed on a hash of the normalized description, the model name and
+the system prompt, and stored as one JSON file each so several uvicorn workers
+can share a directory:
+
+* entries are written to a temp file and ``os.replace``-d into place, so a
+  reader never sees a partial entry;
+* concurrent identical requests share one model call -- in-process through a
+  shared future, across processes through an ``O_EXCL`` lease file that the
+  other workers wait on;
+* eviction drops entries older than ``max_age`` (mtime = creation time) and
+  then the least recently used ones (atime, refreshed on every hit) until the
+  directory is under ``max_bytes``.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from fsutil import try_lock, unlock, write_atomic
+
+ENTRY_SUFFIX = ".json"
+LEASE_SUFFIX = ".lease"
+
+
+class _OwnerCancelled(Exception):
+    """The request producing an entry was cancelled; a waiter takes over."""
+
+
+def normalize_description(description: str) -> str:
+    """Case- and whitespace-insensitive form used for the cache key."""
+    return " ".join(description.split()).casefold()
+
+
+class GenerationCache:
+    def __init__(self, directory, max_bytes: int, max_age: float,
+                 lease_timeout: float = 300.0, poll_interval: float = 0.25,
+                 evict_interval: float = 30.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self.evict_interval = evict_interval
+        self.stats = {"hits": 0, "misses": 0, "shared": 0, "stores": 0, "evictions": 0}
+        self._inflight = {}
+        self._last_evict = 0.0
+
+    @staticmethod
+    def key(description: str, model: str, system_prompt: str) -> str:
+        material = json.dumps([normalize_description(description), model, system_prompt])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.directory / f"{key}{ENTRY_SUFFIX}"
+
+    def _lease(self, key: str) -> Path:
+        return self.directory / f"{key}{LEASE_SUFFIX}"
+
+    # ---- blocking helpers (run through asyncio.to_thread) ----
+    def load(self, key: str):
+        """Return the cached payload for ``key`` or None (expired counts as missing)."""
+        path = self._entry(key)
+        try:
+            st = path.stat()
+            if time.time() - st.st_mtime > self.max_age:
+                return None
+            payload = json.loads(path.read_bytes())
+            # refresh atime only, mtime keeps the creation time for age eviction
+            os.utime(path, (time.time(), st.st_mtime))
+        except (OSError, ValueError):
+            return None
+        return payload
+
+    def store(self, key: str, payload: dict):
+        write_atomic(self._entry(key), json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        self.stats["stores"] += 1
+        if time.time() - self._last_evict >= self.evict_interval:
+            self.evict()
+
+    def _try_lease(self, key: str) -> bool:
+        return try_lock(self._lease(key), self.lease_timeout)
+
+    def _release(self, key: str):
+        unlock(self._lease(key))
+
+    def evict(self) -> int:
+        """Drop expired entries, then LRU entries until under ``max_bytes``."""
+        self._last_evict = now = time.time()
+        entries = []
+        removed = 0
+        for path in self.directory.iterdir():
+            try:
+                st = path.stat()
+                if path.suffix != ENTRY_SUFFIX:
+                    # leftovers of crashed writers
+                    if path.name.endswith(".tmp") and now - st.st_mtime > self.lease_timeout:
+                        path.unlink()
+                    continue
+                if now - st.st_mtime > self.max_age:
+                    path.unlink()
+                    removed += 1
+                    continue
+            except FileNotFoundError:
+                continue  # another worker got there first
+            entries.append((st.st_atime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.stats["evictions"] += removed
+        return removed
+
+    def disk_usage(self) -> dict:
+        entries = 0
+        size = 0
+        for path in self.directory.glob(f"*{ENTRY_SUFFIX}"):
+            try:
+                size += path.stat().st_size
+                entries += 1
+            except FileNotFoundError:
+                pass
+        return {"entries": entries, "bytes": size}
+
+    # ---- async API ----
+    async def fetch(self, key: str, produce):
+        """Return ``(payload, source)`` for ``key``.
+
+        ``source`` is ``"hit"`` (read from disk), ``"shared"`` (another request
+        produced it) or ``"miss"`` (``produce()`` ran here). Payloads marked
+        ``"truncated"`` are handed to waiting callers but never stored. If the
+        caller producing an entry is cancelled, one of its waiters produces it
+        instead of failing along with it.
+        """
+        payload = await asyncio.to_thread(self.load, key)
+        if payload is not None:
+            self.stats["hits"] += 1
+            return payload, "hit"
+
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                payload = await asyncio.shield(inflight)
+            except _OwnerCancelled:
+                continue  # the first waiter to get here becomes the producer
+            self.stats["shared"] += 1
+            return payload, "shared"
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            payload, source = await self._fetch_across_workers(key, produce)
+        except asyncio.CancelledError:
+            # only this caller gave up: hand the work to whoever is waiting
+            future.set_exception(_OwnerCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e if isinstance(e, Exception) else RuntimeError("Generation cancelled"))
+            # nobody may be waiting; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        else:
+            future.set_result(payload)
+        finally:
+            self._inflight.pop(key, None)
+        return payload, source
+
+    async def _fetch_across_workers(self, key: str, produce):
+        waited = False
+        while not await asyncio.to_thread(self._try_lease, key):
+            # another worker is generating the same site: wait for its entry
+            waited = True
+            await asyncio.sleep(self.poll_interval)
+            payload = await asyncio.to_thread(self.load, key)
+            if payload is not None:
+                self.stats["shared"] += 1
+                return payload, "shared"
+
+        try:
+            if waited:
+                # the other worker may have finished right before we got the lease
+                payload = await asyncio.to_thread(self.load, key)
+                if payload is not None:
+                    self.stats["shared"] += 1
+                    return payload, "shared"
+            self.stats["misses"] += 1
+            payload = await produce()
+            if not payload.get("truncated"):
+                await asyncio.to_thread(self.store, key, payload)
+            return payload, "miss"
+        finally:
+            await asyncio.to_thread(self._release, key)
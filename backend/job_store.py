@@ -0,0 +1,190 @@
+"""
+Job state shared by every worker process.
+
+The worker that accepts a job runs it and is the only writer of its state, in
+a directory all uvicorn workers share (the same approach as the generation
+cache):
+
+* ``<job_id>.json`` -- snapshot of the job (status, result, error), replaced
+  atomically on every state change;
+* ``<job_id>.events`` -- append-only log of ``[event, data]`` JSON lines, the
+  line number being the SSE event id;
+* ``<job_id>.cancel`` -- marker another worker drops to ask the owner to
+  cancel the job.
+
+Any worker can therefore answer ``/jobs/{id}`` and ``/jobs/{id}/events`` by
+reading the files; the owner answers from memory without touching them.
+
+The owner's writes never run on the event loop: ``save`` and ``append_event``
+only queue them, and one writer task (``start``/``stop``) performs them in
+order, in batches, on a thread.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from fsutil import write_atomic
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+SNAPSHOT_SUFFIX = ".json"
+EVENTS_SUFFIX = ".events"
+CANCEL_SUFFIX = ".cancel"
+
+
+class JobStore:
+    def __init__(self, directory, poll_interval: float = 0.25):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+        self._writes = None
+        self._writer = None
+
+    def _path(self, job_id: str, suffix: str) -> Path:
+        return self.directory / f"{job_id}{suffix}"
+
+    @staticmethod
+    def valid_id(job_id: str) -> bool:
+        return _JOB_ID.fullmatch(job_id) is not None
+
+    # ---- owner side (queued, written by the writer task) ----
+    def start(self):
+        self._writes = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        """Finish every queued write, then stop the writer."""
+        if self._writer is None:
+            return
+        await self._writes.join()
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._writer = None
+
+    def save(self, snapshot: dict):
+        self._submit(self._save, snapshot)
+
+    def append_event(self, job_id: str, event: str, data: dict):
+        self._submit(self._append_event, job_id, event, data)
+
+    def _submit(self, fn, *args):
+        if self._writer is None:
+            fn(*args)  # no writer running (scripts, tests): write inline
+        else:
+            self._writes.put_nowait((fn, args))
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._writes.get()]
+            while not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+            try:
+                await asyncio.to_thread(self._run_batch, batch)
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+    @staticmethod
+    def _run_batch(batch: list):
+        for fn, args in batch:
+            try:
+                fn(*args)
+            except OSError as e:
+                print(f"Job state write failed: {e}")
+
+    def _save(self, snapshot: dict):
+        write_atomic(
+            self._path(snapshot["job_id"], SNAPSHOT_SUFFIX),
+            json.dumps(snapshot, separators=(",", ":")).encode("utf-8"),
+        )
+
+    def _append_event(self, job_id: str, event: str, data: dict):
+        line = json.dumps([event, data], separators=(",", ":")).encode("utf-8") + b"\n"
+        # one write() on an O_APPEND descriptor: readers see whole lines or nothing
+        fd = os.open(self._path(job_id, EVENTS_SUFFIX), os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def cancel_requests(self) -> set:
+        """Ids of every job some worker asked to cancel."""
+        return {p.name[:-len(CANCEL_SUFFIX)] for p in self.directory.glob(f"*{CANCEL_SUFFIX}")}
+
+    def clear_cancel(self, job_id: str):
+        try:
+            self._path(job_id, CANCEL_SUFFIX).unlink()
+        except FileNotFoundError:
+            pass
+
+    def prune(self, ttl: float) -> int:
+        """Drop the files of jobs untouched for ``ttl`` seconds."""
+        cutoff = time.time() - ttl
+        removed = 0
+        for path in self.directory.glob(f"*{SNAPSHOT_SUFFIX}"):
+            job_id = path.name[:-len(SNAPSHOT_SUFFIX)]
+            paths = [path, self._path(job_id, EVENTS_SUFFIX), self._path(job_id, CANCEL_SUFFIX)]
+            try:
+                if max(p.stat().st_mtime for p in paths if p.exists()) >= cutoff:
+                    continue
+            except (OSError, ValueError):
+                continue
+            for p in paths:
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        return removed
+
+    # ---- reader side (any worker) ----
+    def load(self, job_id: str):
+        """The job's snapshot, with ``files`` brought up to date from its events."""
+        if not self.valid_id(job_id):
+            return None
+        try:
+            snapshot = json.loads(self._path(job_id, SNAPSHOT_SUFFIX).read_bytes())
+        except (OSError, ValueError):
+            return None
+        if snapshot.get("finished_at") is None:
+            events = self.read_events(job_id)
+            snapshot["files"] = [data["path"] for _, event, data in events if event == "file"]
+            for _, event, data in events:
+                if event == "status":
+                    snapshot["status"] = data["status"]
+        return snapshot
+
+    def read_events(self, job_id: str, start: int = 0) -> list:
+        """``[(index, event, data)]`` from ``start``; a half-written last line is skipped."""
+        try:
+            raw = self._path(job_id, EVENTS_SUFFIX).read_bytes()
+        except OSError:
+            return []
+        lines = raw.split(b"\n")[:-1]
+        return [(i, *json.loads(lines[i])) for i in range(start, len(lines))]
+
+    def request_cancel(self, job_id: str):
+        self._path(job_id, CANCEL_SUFFIX).touch()
+
+    async def iter_events(self, job_id: str, start: int = 0):
+        """Follow a job owned by another worker until its ``done`` event."""
+        i = start
+        while True:
+            events = await asyncio.to_thread(self.read_events, job_id, i)
+            for entry in events:
+                yield entry
+                if entry[1] == "done":
+                    return
+            i += len(events)
+            if not events:
+                snapshot = await asyncio.to_thread(self.load, job_id)
+                if snapshot is None:
+                    return
+                if snapshot.get("finished_at") is not None:
+                    # "done" is appended right before the final snapshot
+                    for entry in await asyncio.to_thread(self.read_events, job_id, i):
+                        yield entry
+                    return
+            await asyncio.sleep(self.poll_interval)
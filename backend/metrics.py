@@ -0,0 +1,308 @@
+"""
+In-process metrics for the generation pipeline and the HTTP routes.
+
+Counters and histograms are plain dicts keyed by label values (one lock per
+metric, no allocation beyond the first sample of a label set) and are rendered
+in the Prometheus text format by ``render()`` for ``/metrics``.
+
+* ``span(stage)`` times one pipeline stage (model call, parse, post-process,
+  write, zip) into ``generation_stage_seconds``.
+* ``trace(event, **fields)`` opens a per-job/per-request record that spans and
+  ``annotate()`` add to; with ``METRICS_JSON_LOGS=1`` it is printed as one
+  JSON line when it closes.
+* ``MetricsMiddleware`` records per-route latency under the route template
+  (``/api/tasks/{username}``), so label cardinality stays bounded.
+
+``METRICS=0`` switches all of it off: spans become a shared no-op context
+manager and the middleware passes requests straight through.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+
+ENABLED = os.getenv("METRICS", "1") != "0"
+JSON_LOGS = ENABLED and os.getenv("METRICS_JSON_LOGS", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_registry = []
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, value=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        names = self.labelnames + ("le",)
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {state[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(state[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {state[-1]}"
+
+
+class Gauge:
+    """Read at scrape time from ``fn()``: a number or ``{label_values: number}``."""
+
+    def __init__(self, name: str, documentation: str, fn, labelnames=(), kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        value = self.fn()
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                yield f"{self.name}{_labels(self.labelnames, labels)} {_number(v)}"
+        else:
+            yield f"{self.name} {_number(value)}"
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---- pipeline metrics ----
+STAGE_SECONDS = Histogram(
+    "generation_stage_seconds", "Time spent in each generation pipeline stage.",
+    ("stage",), STAGE_BUCKETS,
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by completion.usage.", ("call", "type"))
+PAYLOAD_BYTES = Histogram(
+    "generation_payload_bytes", "Size of model output and of the files written per project.",
+    ("kind",), SIZE_BUCKETS,
+)
+PARSES = Counter(
+    "model_output_parses_total",
+    "Model output parses by call and outcome (anything but 'direct' took the fallback path).",
+    ("call", "result"),
+)
+JOBS = Counter("generation_jobs_total", "Finished jobs by kind and status.", ("kind", "status"))
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route template.",
+    ("method", "route", "status"),
+)
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record ``seconds`` for ``stage`` (and add it to the current trace)."""
+    if not ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage)
+    record = _trace.get()
+    if record is not None:
+        stages = record["stages"]
+        stages[stage] = round(stages.get(stage, 0.0) + seconds, 6)
+
+
+def span(stage: str):
+    """``with span("llm"): ...`` -- times the block as ``stage``."""
+    return _Span(stage) if ENABLED else _NULL_SPAN
+
+
+def annotate(**fields):
+    """Add fields (numbers are summed) to the current trace, if any."""
+    record = _trace.get()
+    if record is None:
+        return
+    for key, value in fields.items():
+        if isinstance(value, (int, float)) and isinstance(record.get(key), (int, float)):
+            record[key] += value
+        else:
+            record[key] = value
+
+
+def record_usage(call: str, completion):
+    """Count the token usage of a completion (or final stream chunk)."""
+    usage = getattr(completion, "usage", None)
+    if usage is None or not ENABLED:
+        return
+    prompt = getattr(usage, "prompt_tokens", None) or 0
+    output = getattr(usage, "completion_tokens", None) or 0
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+    LLM_TOKENS.inc(call, "prompt", value=prompt)
+    LLM_TOKENS.inc(call, "completion", value=output)
+    if cached:
+        LLM_TOKENS.inc(call, "cached", value=cached)
+    annotate(prompt_tokens=prompt, completion_tokens=output)
+
+
+class trace:
+    """Collect the spans and annotations of one job or request.
+
+    Contexts are copied into tasks and ``asyncio.to_thread`` calls, so work
+    started inside the block reports into the same record.
+    """
+
+    __slots__ = ("record", "token", "start")
+
+    def __init__(self, event: str, **fields):
+        self.record = {"event": event, **fields, "stages": {}} if ENABLED else None
+
+    def __enter__(self):
+        if self.record is not None:
+            self.start = time.perf_counter()
+            self.token = _trace.set(self.record)
+        return self.record
+
+    def __exit__(self, *exc):
+        if self.record is None:
+            return False
+        _trace.reset(self.token)
+        self.record["duration"] = round(time.perf_counter() - self.start, 6)
+        if JSON_LOGS:
+            log(self.record)
+        return False
+
+
+def log(record: dict):
+    print(json.dumps({"ts": round(time.time(), 3), **record}, default=str), flush=True)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording ``http_request_duration_seconds``."""
+
+    def __init__(self, app, exclude=("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            # the template, never the raw path (ids would explode the label set)
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_SECONDS.observe(elapsed, scope["method"], template, status)
+            if JSON_LOGS:
+                log({
+                    "event": "request",
+                    "method": scope["method"],
+                    "route": template,
+                    "path": scope["path"],
+                    "status": status,
+                    "duration": round(elapsed, 6),
+                })
@@ -0,0 +1,198 @@
+"""
+Post-processing of generated files between parsing and writing.
+
+* Inline ``<style>`` / classic ``<script>`` blocks that appear verbatim in two
+  or more pages are hoisted into shared, content-hashed files under
+  ``assets/`` and referenced from every page instead.
+* HTML, CSS and JS are minified conservatively: comments and indentation go,
+  anything whitespace-sensitive (``<pre>``, ``<textarea>``, attribute values,
+  strings, template literals) stays byte for byte.
+* The ``<base>`` tag is injected during the same single scan of each page.
+"""
+import hashlib
+import re
+
+# hoisting a block smaller than this costs more (an extra request) than it saves
+MIN_HOIST_SIZE = 64
+
+_HTML_TOKEN = re.compile(
+    r"(?P<comment><!--(?!\[if).*?-->)"
+    r"|(?P<raw><(?P<tag>script|style|pre|textarea)\b(?P<attrs>[^>]*)>(?P<body>.*?)</(?P=tag)\s*>)"
+    r"|(?P<head><head(?:\s[^>]*)?>)"
+    r"|(?P<open><[a-zA-Z](?:\"[^\"]*\"|'[^']*'|[^'\">])*>)"
+    r"|(?P<ws>\s{2,}|[\t\n\r\f\v])",
+    re.I | re.S,
+)
+_INLINE_BLOCK = re.compile(
+    r"<(?P<tag>script|style)\b(?P<attrs>[^>]*)>(?P<body>.*?)</(?P=tag)\s*>", re.I | re.S
+)
+# whitespace between attributes; quoted values are matched first and kept
+_TAG_WS = re.compile(r"(\"[^\"]*\"|'[^']*')|\s+")
+_CSS_TOKEN = re.compile(
+    r"(?P<str>\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')"
+    r"|(?P<semi>;(?:\s|/\*.*?\*/)*})"
+    r"|(?P<comment>/\*.*?\*/)|(?P<ws>\s+)",
+    re.S,
+)
+# only whitespace containing a line break is rewritten; strings (which may go
+# on over a backslash-newline) and template literals are matched first and kept
+_JS_TOKEN = re.compile(
+    r"(?P<str>\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)"
+    r"|(?P<ws>[^\S\n]*\n\s*)",
+    re.S,
+)
+_CSS_TIGHT = set("{};,>")
+_SCRIPT_TYPE = re.compile(r"""\btype\s*=\s*["']?([^"'\s>]+)""", re.I)
+# ignored on inline scripts but honoured on external ones
+_SCRIPT_DEFERRED = re.compile(r"(?:^|\s)(?:async|defer)(?=[\s=/]|$)", re.I)
+
+
+def minify_css(css: str) -> str:
+    def repl(m):
+        if m.group("str") is not None:
+            return m.group("str")
+        if m.group("semi") is not None:
+            return "}"
+        if m.group("comment") is not None:
+            return ""
+        # whitespace: drop it next to punctuation that doesn't need it
+        s = m.string
+        before = s[m.start() - 1] if m.start() else "{"
+        after = s[m.end()] if m.end() < len(s) else "}"
+        return "" if before in _CSS_TIGHT or after in _CSS_TIGHT else " "
+
+    return _CSS_TOKEN.sub(repl, css).strip()
+
+
+def minify_js(js: str) -> str:
+    """Drop indentation and blank lines; line breaks stay so ASI is unaffected."""
+    return _JS_TOKEN.sub(lambda m: m.group("str") or "\n", js).strip()
+
+
+def _minify_tag(tag: str) -> str:
+    return _TAG_WS.sub(lambda m: m.group(1) or " ", tag)
+
+
+def _is_classic_script(attrs: str) -> bool:
+    if "src" in attrs.lower():
+        return False
+    m = _SCRIPT_TYPE.search(attrs)
+    return m is None or m.group(1).lower() in ("text/javascript", "application/javascript")
+
+
+def _hoistable(tag: str, attrs: str, body: str) -> bool:
+    if len(body.strip()) < MIN_HOIST_SIZE:
+        return False
+    if tag == "style":
+        return not attrs.strip()  # media / nonce attributes stay inline
+    # moving an async/defer block to a file would change when it runs
+    return _is_classic_script(attrs) and not _SCRIPT_DEFERRED.search(attrs)
+
+
+def _asset_path(tag: str, body: str) -> str:
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()[:12]
+    return f"assets/{digest}.{'css' if tag == 'style' else 'js'}"
+
+
+def find_shared_blocks(pages: list) -> dict:
+    """Map ``(tag, body)`` of inline blocks found in 2+ pages to an asset path."""
+    seen = {}
+    for _, html in pages:
+        for m in {
+            (m.group("tag").lower(), m.group("body"))
+            for m in _INLINE_BLOCK.finditer(html)
+            if _hoistable(m.group("tag").lower(), m.group("attrs"), m.group("body"))
+        }:
+            seen[m] = seen.get(m, 0) + 1
+    return {block: _asset_path(*block) for block, count in seen.items() if count > 1}
+
+
+def process_html(html: str, base_tag: str = None, shared: dict = None,
+                 asset_prefix: str = "", minify: bool = True) -> str:
+    """Minify ``html``, swap shared blocks for asset references and add ``base_tag``."""
+    shared = shared or {}
+    state = {"base_done": base_tag is None}
+
+    def repl(m):
+        if m.group("comment") is not None:
+            return "" if minify else m.group(0)
+        if m.group("head") is not None:
+            if state["base_done"]:
+                return m.group(0)
+            state["base_done"] = True
+            return m.group(0) + base_tag
+        if m.group("open") is not None:
+            return _minify_tag(m.group(0)) if minify else m.group(0)
+        if m.group("ws") is not None:
+            if not minify:
+                return m.group(0)
+            return "\n" if "\n" in m.group(0) else " "
+        # raw block
+        tag = m.group("tag").lower()
+        attrs, body = m.group("attrs"), m.group("body")
+        asset = shared.get((tag, body)) if _hoistable(tag, attrs, body) else None
+        if asset is not None:
+            if tag == "style":
+                return f'<link rel="stylesheet" href="{asset_prefix}{asset}">'
+            return f'<script{attrs} src="{asset_prefix}{asset}"></script>'
+        if not minify or tag in ("pre", "textarea"):
+            return m.group(0)
+        if tag == "style":
+            body = minify_css(body)
+        elif _is_classic_script(attrs):
+            body = minify_js(body)
+        else:
+            return m.group(0)
+        return f"<{m.group('tag')}{attrs}>{body}</{m.group('tag')}>"
+
+    out = _HTML_TOKEN.sub(repl, html)
+    if not state["base_done"]:
+        # no <head>: prepend one with the base tag
+        out = f"<head>{base_tag}</head>\n" + out
+    return out
+
+
+def process_files(files: list, base_href: str = None, hoist: bool = True,
+                  minify: bool = True):
+    """Run the pipeline over ``[(rel_path, content_str)]``.
+
+    Returns ``([(rel_path, bytes)], stats)`` where ``stats`` compares the
+    bytes written against the unprocessed (but base-tagged) files and counts
+    the shared assets created.
+    """
+    pages = [(p, c) for p, c in files if p.endswith(".html")]
+    shared = find_shared_blocks(pages) if hoist and len(pages) > 1 else {}
+    base_tag = f'<base href="{base_href}" />' if base_href else None
+
+    out = []
+    bytes_before = 0
+    for path, content in files:
+        bytes_before += len(content.encode("utf-8"))
+        if path.endswith(".html"):
+            bytes_before += len(base_tag or "")
+            # with a <base> tag relative URLs resolve against base_href, i.e. the
+            # project root, whatever directory the page lives in
+            prefix = "" if base_tag else "../" * path.count("/")
+            content = process_html(content, base_tag, shared, prefix, minify)
+        elif minify and path.endswith(".css"):
+            content = minify_css(content)
+        elif minify and path.endswith(".js"):
+            content = minify_js(content)
+        out.append((path, content.encode("utf-8")))
+
+    existing = {p for p, _ in out}
+    for (tag, body), asset in sorted(shared.items(), key=lambda item: item[1]):
+        if asset in existing:
+            continue
+        body = (minify_css(body) if tag == "style" else minify_js(body)) if minify else body
+        out.append((asset, body.encode("utf-8")))
+        existing.add(asset)
+
+    bytes_after = sum(len(data) for _, data in out)
+    stats = {
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved": bytes_before - bytes_after,
+        "shared_assets": len(shared),
+    }
+    return out, stats
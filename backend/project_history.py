@@ -0,0 +1,88 @@
+"""
+Version history of edited projects.
+
+File contents are stored once as content-addressed blobs (``blobs/<sha256>``,
+shared by every project and version); each project keeps a small JSON
+manifest listing its versions as ``{path: sha256}`` maps. A version therefore
+costs only the files that changed, and rolling back is a manifest lookup plus
+reading the blobs that differ.
+
+Edits and rollbacks of one project are serialized across every worker process
+by a lock file next to its manifest (``fsutil.try_lock``); a lock older than
+``lock_timeout`` belongs to a dead worker and is broken.
+"""
+import hashlib
+import json
+import time
+from pathlib import Path
+
+from fsutil import try_lock, unlock, write_atomic
+
+LOCK_SUFFIX = ".lock"
+
+
+class ProjectHistory:
+    def __init__(self, root, lock_timeout: float = 600.0):
+        self.root = Path(root)
+        self.blobs = self.root / "blobs"
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        self.lock_timeout = lock_timeout
+
+    def _manifest(self, project_id: str) -> Path:
+        return self.root / f"{project_id}.json"
+
+    def _lock(self, project_id: str) -> Path:
+        return self.root / f"{project_id}{LOCK_SUFFIX}"
+
+    def try_lock(self, project_id: str) -> bool:
+        return try_lock(self._lock(project_id), self.lock_timeout)
+
+    def unlock(self, project_id: str):
+        unlock(self._lock(project_id))
+
+    def put_blob(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blobs / digest
+        if not path.exists():
+            write_atomic(path, data)
+        return digest
+
+    def get_blob(self, digest: str) -> bytes:
+        return (self.blobs / digest).read_bytes()
+
+    def versions(self, project_id: str) -> list:
+        try:
+            return json.loads(self._manifest(project_id).read_bytes())
+        except (OSError, ValueError):
+            return []
+
+    def record(self, project_id: str, files: dict, note: str = "", **extra) -> int:
+        """Store ``{path: bytes}`` as the next version of ``project_id``."""
+        versions = self.versions(project_id)
+        version = versions[-1]["version"] + 1 if versions else 1
+        versions.append({
+            "version": version,
+            "created": time.time(),
+            "note": note,
+            "files": {path: self.put_blob(data) for path, data in sorted(files.items())},
+            **extra,
+        })
+        write_atomic(self._manifest(project_id), json.dumps(versions).encode("utf-8"))
+        return version
+
+    def get(self, project_id: str, version: int):
+        for entry in self.versions(project_id):
+            if entry["version"] == version:
+                return entry
+        return None
+
+    def diff(self, entry: dict, current: dict):
+        """``(changed, removed)`` that turn ``current`` ({path: bytes}) into ``entry``."""
+        current_hashes = {p: hashlib.sha256(d).hexdigest() for p, d in current.items()}
+        changed = [
+            (path, self.get_blob(digest))
+            for path, digest in entry["files"].items()
+            if current_hashes.get(path) != digest
+        ]
+        removed = [path for path in current if path not in entry["files"]]
+        return changed, removed
@@ -0,0 +1,388 @@
+"""
+Storage back ends for generated projects.
+
+``FolderStore`` keeps the classic layout: every page on disk under
+``<root>/<project_id>/`` plus a ``<project_id>.zip`` for download.
+``ArchiveStore`` keeps only the compressed ``<project_id>.zip`` and serves
+pages straight out of it through a small cache of open archive handles.
+
+In both cases the zip is built from the in-memory files (never re-read from
+disk) with ZIP_DEFLATED, and members live under ``<project_id>/`` so the
+download layout is unchanged. All methods do blocking I/O; call them through
+``asyncio.to_thread`` from async code.
+
+Compressed variants for HTTP serving are prepared once, at write time:
+``FolderStore`` writes ``.gz`` (and ``.br`` when the optional ``brotli``
+package is installed) next to each text file; ``ArchiveStore`` hands out the
+member's already-deflated bytes wrapped as gzip, so nothing is stored twice.
+"""
+import copy
+import gzip
+import os
+import shutil
+import struct
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import metrics
+from fsutil import temp_path
+
+try:
+    import brotli
+except ImportError:  # optional: brotli variants are skipped without it
+    brotli = None
+
+COMPRESSIBLE_SUFFIXES = (".html", ".css", ".js", ".json", ".svg", ".txt", ".xml")
+# below this, compression overhead outweighs the savings
+MIN_COMPRESS_SIZE = 256
+# marks an archive whose project has been finalized (no more writes)
+COMPLETE_COMMENT = b"complete"
+VARIANT_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class StoredFile:
+    """A servable project file: either a path on disk or in-memory bytes."""
+
+    __slots__ = ("path", "data", "size", "mtime", "complete")
+
+    def __init__(self, size: int, mtime: float, path: Path = None, data: bytes = None,
+                 complete: bool = False):
+        self.path = path
+        self.data = data
+        self.size = size
+        self.mtime = mtime
+        self.complete = complete  # project finalized, content will not change
+
+    def read(self) -> bytes:
+        return self.data if self.data is not None else self.path.read_bytes()
+
+
+def is_compressible(path: str, data: bytes) -> bool:
+    return path.endswith(COMPRESSIBLE_SUFFIXES) and len(data) >= MIN_COMPRESS_SIZE
+
+
+def compress_variants(path: str, data: bytes) -> dict:
+    """Return ``{encoding: bytes}`` for every variant worth serving."""
+    if not is_compressible(path, data):
+        return {}
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, mode=brotli.MODE_TEXT)
+    return {enc: v for enc, v in variants.items() if len(v) < len(data)}
+
+
+def with_index(files: list) -> list:
+    """Ensure index.html exists (fallback to first HTML file if not provided)."""
+    if any(path == "index.html" for path, _ in files):
+        return files
+    html = sorted((path, data) for path, data in files if path.endswith(".html"))
+    if html:
+        return files + [("index.html", html[0][1])]
+    return files
+
+
+def _write_zip(zip_path: Path, project_id: str, files: list, comment: bytes = b""):
+    # build next to the target and swap it in, so readers never see half a zip
+    tmp = temp_path(zip_path)
+    with metrics.span("zip"):
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zipf:
+            for path, data in files:
+                zipf.writestr(f"{project_id}/{path}", data)
+            zipf.comment = comment
+        os.replace(tmp, zip_path)
+
+
+def _gzip_from_member(zip_path: Path, info: zipfile.ZipInfo, st: os.stat_result):
+    """Wrap a deflated zip member's raw stream in a gzip header and trailer.
+
+    ``info`` was read from the archive ``st`` describes; returns None if
+    ``zip_path`` has been replaced since, as its offsets would be wrong.
+    """
+    with open(zip_path, "rb") as f:
+        opened = os.fstat(f.fileno())
+        if (opened.st_mtime_ns, opened.st_size) != (st.st_mtime_ns, st.st_size):
+            return None
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        raw = f.read(info.compress_size)
+    return (
+        b"\x1f\x8b\x08\x00" + struct.pack("<I", int(st.st_mtime)) + b"\x00\xff"
+        + raw + struct.pack("<II", info.CRC, info.file_size & 0xFFFFFFFF)
+    )
+
+
+def _copy_raw_member(src_fp, info: zipfile.ZipInfo, dst: zipfile.ZipFile) -> bool:
+    """Append an already-compressed member to ``dst`` without recompressing it.
+
+    Returns False when the member can't be copied verbatim (data descriptor).
+    """
+    if info.flag_bits & 0x08:
+        return False
+    src_fp.seek(info.header_offset)
+    header = src_fp.read(30)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    record = header + src_fp.read(name_len + extra_len + info.compress_size)
+    new_info = copy.copy(info)
+    dst.fp.seek(dst.start_dir)
+    new_info.header_offset = dst.fp.tell()
+    dst.fp.write(record)
+    dst.start_dir = dst.fp.tell()
+    dst.filelist.append(new_info)
+    dst.NameToInfo[new_info.filename] = new_info
+    dst._didModify = True
+    return True
+
+
+def _update_zip(zip_path: Path, project_id: str, changed: list, removed=()):
+    """Rewrite ``zip_path`` with ``changed`` members replaced or added and
+    ``removed`` ones dropped; untouched members are copied byte for byte."""
+    prefix = f"{project_id}/"
+    skip = {prefix + path for path, _ in changed} | {prefix + path for path in removed}
+    tmp = temp_path(zip_path)
+    with metrics.span("zip"), zipfile.ZipFile(zip_path) as src, open(zip_path, "rb") as src_fp, \
+            zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            if info.filename in skip:
+                continue
+            if not _copy_raw_member(src_fp, info, dst):
+                dst.writestr(info, src.read(info))
+        for path, data in changed:
+            dst.writestr(prefix + path, data)
+        dst.comment = src.comment
+    os.replace(tmp, zip_path)
+
+
+def _read_zip(zip_path: Path, project_id: str) -> dict:
+    """``{rel_path: bytes}`` of every project file in the archive."""
+    prefix = f"{project_id}/"
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            return {
+                info.filename[len(prefix):]: zf.read(info)
+                for info in zf.infolist()
+                if info.filename.startswith(prefix) and not info.is_dir()
+                # the old duplicate of index.html, no longer written
+                and info.filename != prefix + "index_preview.html"
+            }
+    except (OSError, zipfile.BadZipFile):
+        return {}
+
+
+def _zip_version(zip_path: Path):
+    try:
+        st = zip_path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _dedupe(files: list) -> list:
+    # a path given twice keeps its last content
+    return list(dict(files).items())
+
+
+class FolderStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def zip_path(self, project_id: str) -> Path:
+        return self.root / f"{project_id}.zip"
+
+    def write_file(self, project_id: str, path: str, data: bytes):
+        target = self.root / project_id / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        variants = compress_variants(path, data)
+        for encoding, suffix in VARIANT_SUFFIXES.items():
+            sidecar = target.with_name(target.name + suffix)
+            if encoding in variants:
+                sidecar.write_bytes(variants[encoding])
+            else:
+                # a variant of the previous content would be served in place of this one
+                try:
+                    sidecar.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def write_all(self, project_id: str, files: list):
+        (self.root / project_id).mkdir(parents=True, exist_ok=True)
+        for path, data in _dedupe(files):
+            self.write_file(project_id, path, data)
+        self.finalize(project_id, files)
+
+    def finalize(self, project_id: str, files: list):
+        """Add the index fallback and zip the project (files already written)."""
+        files = _dedupe(files)
+        complete = with_index(files)
+        if len(complete) > len(files):
+            self.write_file(project_id, *complete[-1])
+        _write_zip(self.zip_path(project_id), project_id, complete)
+
+    def get(self, project_id: str, path: str):
+        file_path = self.root / project_id / path
+        try:
+            st = file_path.stat()
+        except OSError:
+            return None
+        if not file_path.is_file():
+            return None
+        # the zip is only written once every page is in place
+        complete = self.zip_path(project_id).exists()
+        return StoredFile(st.st_size, st.st_mtime, path=file_path, complete=complete)
+
+    def read_all(self, project_id: str) -> dict:
+        return _read_zip(self.zip_path(project_id), project_id)
+
+    def version(self, project_id: str):
+        """Changes whenever the project's files do (the zip is always rewritten)."""
+        return _zip_version(self.zip_path(project_id))
+
+    def update(self, project_id: str, changed: list, removed=()):
+        """Replace / add ``changed`` files and drop ``removed`` ones in a finished project."""
+        for path, data in changed:
+            self.write_file(project_id, path, data)
+        for path in removed:
+            target = self.root / project_id / path
+            for p in [target] + [target.with_name(target.name + s) for s in VARIANT_SUFFIXES.values()]:
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
+        _update_zip(self.zip_path(project_id), project_id, changed, removed)
+
+    def variants(self, project_id: str, path: str, stored: StoredFile) -> dict:
+        variants = {}
+        for encoding, suffix in VARIANT_SUFFIXES.items():
+            try:
+                variants[encoding] = (self.root / project_id / (path + suffix)).read_bytes()
+            except OSError:
+                pass
+        return variants
+
+    def list_files(self, project_id: str) -> list:
+        folder = self.root / project_id
+        return sorted(
+            p.relative_to(folder).as_posix() for p in folder.rglob("*")
+            if p.is_file() and p.suffix not in (".gz", ".br")
+        )
+
+
+class ArchiveStore:
+    def __init__(self, root: Path, max_open: int = 64):
+        self.root = Path(root)
+        self.max_open = max_open
+        self._handles = OrderedDict()  # zip path -> ((mtime_ns, size), ZipFile)
+        self._lock = threading.Lock()
+
+    def zip_path(self, project_id: str) -> Path:
+        return self.root / f"{project_id}.zip"
+
+    def write_file(self, project_id: str, path: str, data: bytes):
+        """Add one member while a project is still streaming in.
+
+        The archive is copied, appended to and swapped in, so concurrent
+        readers keep a consistent view; ``finalize`` rewrites it compactly.
+        """
+        zip_path = self.zip_path(project_id)
+        tmp = temp_path(zip_path)
+        if zip_path.exists():
+            shutil.copyfile(zip_path, tmp)
+            mode = "a"
+        else:
+            mode = "w"
+        with zipfile.ZipFile(tmp, mode, compression=zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr(f"{project_id}/{path}", data)
+        os.replace(tmp, zip_path)
+
+    def write_all(self, project_id: str, files: list):
+        self.finalize(project_id, files)
+
+    def finalize(self, project_id: str, files: list):
+        _write_zip(
+            self.zip_path(project_id), project_id, with_index(_dedupe(files)),
+            comment=COMPLETE_COMMENT,
+        )
+
+    def read_all(self, project_id: str) -> dict:
+        return _read_zip(self.zip_path(project_id), project_id)
+
+    def version(self, project_id: str):
+        return _zip_version(self.zip_path(project_id))
+
+    def update(self, project_id: str, changed: list, removed=()):
+        _update_zip(self.zip_path(project_id), project_id, changed, removed)
+
+    def _open(self, project_id: str):
+        zip_path = self.zip_path(project_id)
+        try:
+            st = zip_path.stat()
+        except OSError:
+            return None, None
+        sig = (st.st_mtime_ns, st.st_size)
+        key = str(zip_path)
+        with self._lock:
+            cached = self._handles.get(key)
+            if cached is not None and cached[0] == sig:
+                self._handles.move_to_end(key)
+                return cached[1], st
+        try:
+            zf = zipfile.ZipFile(zip_path)
+        except (OSError, zipfile.BadZipFile):
+            return None, None
+        with self._lock:
+            # replaced handles are closed by garbage collection once no
+            # in-flight read still uses them
+            self._handles[key] = (sig, zf)
+            self._handles.move_to_end(key)
+            while len(self._handles) > self.max_open:
+                self._handles.popitem(last=False)
+        return zf, st
+
+    def get(self, project_id: str, path: str):
+        zf, st = self._open(project_id)
+        if zf is None:
+            return None
+        try:
+            data = zf.read(f"{project_id}/{path}")
+        except KeyError:
+            return None
+        return StoredFile(
+            len(data), st.st_mtime, data=data, complete=zf.comment == COMPLETE_COMMENT
+        )
+
+    def variants(self, project_id: str, path: str, stored: StoredFile) -> dict:
+        if not is_compressible(path, stored.data):
+            return {}
+        zf, st = self._open(project_id)
+        if zf is None:
+            return {}
+        try:
+            info = zf.getinfo(f"{project_id}/{path}")
+        except KeyError:
+            return {}
+        if info.compress_type != zipfile.ZIP_DEFLATED or info.compress_size >= info.file_size:
+            return {}
+        if info.CRC != zlib.crc32(stored.data):
+            return {}  # the archive changed since ``stored`` was read
+        body = _gzip_from_member(self.zip_path(project_id), info, st)
+        return {"gzip": body} if body is not None else {}
+
+    def list_files(self, project_id: str) -> list:
+        zf, _ = self._open(project_id)
+        if zf is None:
+            return []
+        prefix = f"{project_id}/"
+        return sorted(n[len(prefix):] for n in zf.namelist() if n.startswith(prefix))
+
+
+def create_store(kind: str, root: Path):
+    if kind == "archive":
+        return ArchiveStore(root)
+    if kind == "files":
+        return FolderStore(root)
+    raise ValueError(f"Unknown PROJECT_STORAGE {kind!r} (expected 'files' or 'archive')")
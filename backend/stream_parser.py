@@ -0,0 +1,138 @@
+"""
+Incremental parser for the model's ``{"files": [{"path", "content"}, ...]}`` output.
+
+Text can be fed in arbitrary chunks (e.g. streamed tokens). Every file object
+is returned as soon as its closing brace arrives, so pages can be written
+before the rest of the site exists. Each character is scanned once and each
+object is decoded once, which keeps recovery of truncated output linear.
+"""
+import json
+import re
+
+# characters that end a run of ordinary string content
+_STRING_SPECIAL = re.compile(r'[\\"]')
+
+
+class FilesStreamParser:
+    """Pull complete file objects out of a (possibly truncated) JSON stream."""
+
+    def __init__(self):
+        self._stack = []          # open '{' / '[' containers
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False  # next top-level string is an object key
+        self._key_parts = None    # pieces of the top-level key being read
+        self._last_key = None
+        self._files_depth = None  # stack depth of the open "files" array
+        self._obj_parts = None    # pieces of the file object being read
+        self.done = False         # top-level object closed
+        self.skipped = 0          # malformed entries in the files array
+
+    def feed(self, chunk: str) -> list:
+        """Consume ``chunk`` and return the file objects it completed."""
+        out = []
+        if self.done or not chunk:
+            return out
+        stack = self._stack
+        key_from = 0 if self._key_parts is not None else None
+        obj_from = 0 if self._obj_parts is not None else None
+        i, n = 0, len(chunk)
+
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                m = _STRING_SPECIAL.search(chunk, i)
+                if m is None:
+                    break
+                j = m.start()
+                if chunk[j] == "\\":
+                    self._escape = True
+                    i = j + 1
+                    continue
+                # closing quote
+                self._in_string = False
+                if key_from is not None:
+                    self._key_parts.append(chunk[key_from:j])
+                    self._last_key = _decode_string("".join(self._key_parts))
+                    self._key_parts = key_from = None
+                i = j + 1
+                continue
+
+            c = chunk[i]
+            if not stack:
+                # skip any prose / markdown fences before the top-level object
+                if c == "{":
+                    stack.append(c)
+                    self._expect_key = True
+                i += 1
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if len(stack) == 1 and self._expect_key:
+                    self._key_parts = []
+                    key_from = i + 1
+            elif c == "{" or c == "[":
+                stack.append(c)
+                depth = len(stack)
+                if c == "[" and depth == 2 and self._last_key == "files":
+                    self._files_depth = depth
+                elif c == "{" and self._files_depth and depth == self._files_depth + 1:
+                    self._obj_parts = []
+                    obj_from = i
+            elif c == "}" or c == "]":
+                depth = len(stack)
+                if obj_from is not None and c == "}" and depth == self._files_depth + 1:
+                    self._obj_parts.append(chunk[obj_from:i + 1])
+                    fileobj = self._decode_file("".join(self._obj_parts))
+                    if fileobj is not None:
+                        out.append(fileobj)
+                    self._obj_parts = obj_from = None
+                elif c == "]" and depth == self._files_depth:
+                    self._files_depth = None
+                stack.pop()
+                if not stack:
+                    self.done = True
+                    break
+            elif len(stack) == 1:
+                if c == ",":
+                    self._expect_key = True
+                elif c == ":":
+                    self._expect_key = False
+            i += 1
+
+        if key_from is not None:
+            self._key_parts.append(chunk[key_from:])
+        if obj_from is not None:
+            self._obj_parts.append(chunk[obj_from:])
+        return out
+
+    def _decode_file(self, text: str):
+        try:
+            obj = json.loads(text)
+        except ValueError:
+            self.skipped += 1
+            return None
+        if (
+            not isinstance(obj, dict)
+            or not isinstance(obj.get("path"), str)
+            or not isinstance(obj.get("content"), str)
+        ):
+            self.skipped += 1
+            return None
+        return obj
+
+
+def _decode_string(body: str) -> str:
+    try:
+        return json.loads(f'"{body}"')
+    except ValueError:
+        return body
+
+
+def recover_files(text: str) -> list:
+    """Return every complete file object found in ``text``."""
+    return FilesStreamParser().feed(text)
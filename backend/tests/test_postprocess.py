@@ -0,0 +1,102 @@
+from postprocess import minify_css, minify_js, process_files, process_html
+
+STYLE = "<style>" + "body { color: red; margin: 0; padding: 0; font-family: sans-serif; }\n" + "</style>"
+
+
+def page(body: str = "") -> str:
+    return f"<html><head>{STYLE}</head><body>{body}</body></html>"
+
+
+def test_minify_js_keeps_template_literals():
+    js = "const html = `<ul>\n    <li>a</li>\n  </ul>`;\n\n    render(html);\n"
+    assert minify_js(js) == "const html = `<ul>\n    <li>a</li>\n  </ul>`;\nrender(html);"
+
+
+def test_minify_js_keeps_string_line_continuations():
+    js = 'let s = "one\\\n    two";\n    let t = \'a   b\';  \n'
+    assert minify_js(js) == 'let s = "one\\\n    two";\nlet t = \'a   b\';'
+
+
+def test_minify_js_keeps_line_breaks_for_asi():
+    assert minify_js("  let a = 1\n\n   let b = 2\n") == "let a = 1\nlet b = 2"
+
+
+def test_minify_css_drops_comments_and_last_semicolon():
+    css = "a  {\n  color : red ;\n  /* note */\n}\nb > i { margin: 0 }"
+    assert minify_css(css) == "a{color : red}b>i{margin: 0}"
+
+
+def test_minify_css_keeps_strings():
+    css = 'a::after { content: ";}  x"; }'
+    assert minify_css(css) == 'a::after{content: ";}  x"}'
+
+
+def test_html_attribute_values_unchanged():
+    html = '<div  title="a   b"\n     class="x"><input value=\'  v  \'>  text\n\n  here</div>'
+    assert process_html(html) == '<div title="a   b" class="x"><input value=\'  v  \'> text\nhere</div>'
+
+
+def test_html_raw_blocks_unchanged():
+    html = "<pre>  a\n    b</pre><textarea>  x  </textarea>"
+    assert process_html(html) == html
+
+
+def test_html_comments_removed_but_not_conditionals():
+    html = "<!-- gone --><!--[if IE]><p>old</p><![endif]-->"
+    assert process_html(html) == "<!--[if IE]><p>old</p><![endif]-->"
+
+
+def test_base_tag_injected_once():
+    out = process_html("<html><head><title>t</title></head></html>", '<base href="/p/" />')
+    assert out == '<html><head><base href="/p/" /><title>t</title></head></html>'
+    assert process_html("<p>x</p>", '<base href="/p/" />').startswith('<head><base href="/p/" /></head>')
+
+
+def test_no_minify_passes_html_through():
+    html = '<div  title="a   b">\n  <!-- c -->\n</div>'
+    assert process_html(html, minify=False) == html
+
+
+def test_shared_blocks_are_hoisted():
+    files = [("index.html", page("a")), ("about.html", page("b"))]
+    out, stats = process_files(files)
+    result = dict(out)
+    assets = [p for p in result if p.startswith("assets/")]
+    assert len(assets) == 1 and assets[0].endswith(".css")
+    assert stats["shared_assets"] == 1
+    for name in ("index.html", "about.html"):
+        assert f'<link rel="stylesheet" href="{assets[0]}">'.encode() in result[name]
+        assert b"<style>" not in result[name]
+
+
+def test_hoisted_links_in_nested_pages():
+    files = [("index.html", page()), ("blog/post.html", page())]
+    out, _ = process_files(files)
+    asset = next(p for p, _ in out if p.startswith("assets/"))
+    assert f'href="../{asset}"'.encode() in dict(out)["blog/post.html"]
+
+    # with a <base> tag every relative URL starts from the project root
+    out, _ = process_files(files, base_href="/generated_projects/p/")
+    assert f'href="{asset}"'.encode() in dict(out)["blog/post.html"]
+
+
+def test_single_page_is_not_hoisted():
+    out, stats = process_files([("index.html", page())])
+    assert [p for p, _ in out] == ["index.html"]
+    assert stats["shared_assets"] == 0
+
+
+def test_async_and_defer_scripts_stay_inline():
+    script = "console.log('ready'); document.body.classList.add('loaded'); init();"
+    files = [
+        ("index.html", f"<body><script defer>{script}</script></body>"),
+        ("about.html", f"<body><script async>{script}</script></body>"),
+        ("contact.html", f"<body><script>{script}</script></body>"),
+        ("help.html", f"<body><script>{script}</script></body>"),
+    ]
+    out, stats = process_files(files)
+    result = dict(out)
+    assert stats["shared_assets"] == 1
+    assert result["index.html"] == f"<body><script defer>{script}</script></body>".encode()
+    assert result["about.html"] == f"<body><script async>{script}</script></body>".encode()
+    assert b' src="assets/' in result["contact.html"]
@@ -0,0 +1,36 @@
+import os
+import time
+
+from project_history import ProjectHistory
+
+
+def test_versions_share_blobs(tmp_path):
+    history = ProjectHistory(tmp_path)
+    assert history.record("p", {"index.html": b"a", "about.html": b"b"}) == 1
+    assert history.record("p", {"index.html": b"c", "about.html": b"b"}, note="edit") == 2
+    assert len(list(history.blobs.iterdir())) == 3
+
+    entry = history.get("p", 1)
+    changed, removed = history.diff(entry, {"index.html": b"c", "about.html": b"b", "new.html": b"x"})
+    assert changed == [("index.html", b"a")]
+    assert removed == ["new.html"]
+    assert history.get("p", 3) is None
+
+
+def test_lock_is_exclusive(tmp_path):
+    first, second = ProjectHistory(tmp_path), ProjectHistory(tmp_path)
+    assert first.try_lock("p")
+    assert not second.try_lock("p")
+    assert second.try_lock("q")  # locks are per project
+    first.unlock("p")
+    assert second.try_lock("p")
+
+
+def test_stale_lock_is_broken(tmp_path):
+    history = ProjectHistory(tmp_path, lock_timeout=60)
+    assert history.try_lock("p")
+    lock = tmp_path / "p.lock"
+    old = time.time() - 120
+    os.utime(lock, (old, old))
+    assert history.try_lock("p")
+    assert lock.read_text() == str(os.getpid())
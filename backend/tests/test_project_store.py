@@ -0,0 +1,100 @@
+import gzip
+import zipfile
+
+import pytest
+
+from project_history import ProjectHistory
+from project_store import ArchiveStore, _gzip_from_member, create_store
+
+PAGE = ("<html><body>" + "<p>Lorem ipsum dolor sit amet.</p>\n" * 200 + "</body></html>").encode()
+
+
+def test_archive_gzip_variant_is_the_member(tmp_path):
+    store = ArchiveStore(tmp_path)
+    store.finalize("p", [("index.html", PAGE)])
+    stored = store.get("p", "index.html")
+    variants = store.variants("p", "index.html", stored)
+    assert gzip.decompress(variants["gzip"]) == PAGE
+
+
+def test_archive_gzip_variant_of_a_replaced_archive(tmp_path):
+    store = ArchiveStore(tmp_path)
+    store.finalize("p", [("index.html", PAGE)])
+    stored = store.get("p", "index.html")
+    zip_path = store.zip_path("p")
+    st = zip_path.stat()
+    with zipfile.ZipFile(zip_path) as zf:
+        info = zf.getinfo("p/index.html")
+
+    store.finalize("p", [("about.html", PAGE[:100]), ("index.html", PAGE.replace(b"Lorem", b"Ipsum"))])
+    # offsets from the old archive are never applied to the new one
+    assert _gzip_from_member(zip_path, info, st) is None
+    # and the identity read before the swap gets no variant of the new content
+    assert store.variants("p", "index.html", stored) == {}
+
+
+ABOUT = PAGE.replace(b"Lorem", b"About")
+SCRIPT = b"document.querySelectorAll('a').forEach(function (a) { a.classList.add('link'); });\n" * 8
+SMALL = b"<p>tiny</p>"
+
+
+@pytest.fixture(params=["files", "archive"])
+def store(request, tmp_path):
+    return create_store(request.param, tmp_path)
+
+
+def edit(store, history, project_id, changed, removed=()):
+    """What /projects/{id}/edit and /rollback do once the lock is held."""
+    current = store.read_all(project_id)
+    if not history.versions(project_id):
+        history.record(project_id, current, note="generated")
+    store.update(project_id, changed, removed)
+    merged = {**current, **dict(changed)}
+    for path in removed:
+        merged.pop(path, None)
+    return history.record(project_id, merged)
+
+
+def rollback(store, history, project_id, version):
+    entry = history.get(project_id, version)
+    changed, removed = history.diff(entry, store.read_all(project_id))
+    store.update(project_id, changed, removed)
+    return history.record(project_id, {p: history.get_blob(d) for p, d in entry["files"].items()})
+
+
+def assert_serves(store, project_id, files):
+    with zipfile.ZipFile(store.zip_path(project_id)) as zf:
+        assert zf.testzip() is None
+    assert store.read_all(project_id) == files
+    assert set(store.list_files(project_id)) == set(files)
+    for path, data in files.items():
+        stored = store.get(project_id, path)
+        assert stored.read() == data
+        variants = store.variants(project_id, path, stored)
+        if "gzip" in variants:
+            assert gzip.decompress(variants["gzip"]) == data
+
+
+def test_edit_and_rollback(store, tmp_path):
+    history = ProjectHistory(tmp_path / "history")
+    original = {"index.html": PAGE, "about.html": ABOUT, "assets/app.js": SCRIPT, "tiny.html": SMALL}
+    store.write_all("p", list(original.items()))
+    assert_serves(store, "p", original)
+
+    new_index = PAGE.replace(b"Lorem", b"Edited")
+    assert edit(store, history, "p", [("index.html", new_index), ("contact.html", SMALL)]) == 2
+    edited = {**original, "index.html": new_index, "contact.html": SMALL}
+    assert_serves(store, "p", edited)
+
+    # a second edit copies members that were themselves copied raw
+    assert edit(store, history, "p", [("about.html", ABOUT[:300])], removed=["tiny.html"]) == 3
+    edited = {**edited, "about.html": ABOUT[:300]}
+    del edited["tiny.html"]
+    assert_serves(store, "p", edited)
+    assert store.get("p", "tiny.html") is None
+
+    assert rollback(store, history, "p", 1) == 4
+    assert_serves(store, "p", original)
+    assert store.get("p", "contact.html") is None
+    assert [v["version"] for v in history.versions("p")] == [1, 2, 3, 4]
+    assert "gzip" in store.variants("p", "index.html", store.get("p", "index.html"))
@@ -0,0 +1,66 @@
+import json
+
+from stream_parser import FilesStreamParser, recover_files
+
+FILES = [
+    {"path": "index.html", "content": '<p class="x">{"not": "json"}</p>'},
+    {"path": "assets/app.js", "content": 'const s = "a \\" ] }";\n'},
+    {"path": "style.css", "content": "a { color: red; }"},
+]
+TEXT = json.dumps({"files": FILES, "notes": {"files": []}})
+
+
+def test_whole_document():
+    parser = FilesStreamParser()
+    assert parser.feed(TEXT) == FILES
+    assert parser.done
+    assert parser.skipped == 0
+
+
+def test_every_chunk_size_gives_the_same_files():
+    for size in (1, 2, 3, 7, 64):
+        parser = FilesStreamParser()
+        out = []
+        for i in range(0, len(TEXT), size):
+            out.extend(parser.feed(TEXT[i:i + size]))
+        assert out == FILES, size
+        assert parser.done
+
+
+def test_files_are_returned_as_soon_as_they_close():
+    parser = FilesStreamParser()
+    first_end = TEXT.index(json.dumps(FILES[0])) + len(json.dumps(FILES[0]))
+    assert parser.feed(TEXT[:first_end - 1]) == []
+    assert parser.feed(TEXT[first_end - 1:first_end]) == FILES[:1]
+
+
+def test_truncated_output_keeps_complete_files():
+    cut = TEXT.index('"style.css"') + 5
+    assert recover_files(TEXT[:cut]) == FILES[:2]
+
+
+def test_prose_and_fences_around_the_json():
+    assert recover_files(f"Sure! Here it is:\n```json\n{TEXT}\n```\nEnjoy!") == FILES
+
+
+def test_malformed_entries_are_skipped():
+    text = json.dumps({"files": [{"path": "a.html"}, FILES[0], {"path": 1, "content": "x"}]})
+    parser = FilesStreamParser()
+    assert parser.feed(text) == FILES[:1]
+    assert parser.skipped == 2
+
+
+def test_only_the_top_level_files_key_counts():
+    text = json.dumps({"meta": {"files": [FILES[0]]}, "files": [FILES[1]]})
+    assert recover_files(text) == [FILES[1]]
+
+
+def test_escaped_key():
+    text = '{"fil\\u0065s": [' + json.dumps(FILES[0]) + "]}"
+    assert recover_files(text) == FILES[:1]
+
+
+def test_feed_after_done_is_ignored():
+    parser = FilesStreamParser()
+    parser.feed(TEXT)
+    assert parser.feed(TEXT) == []
@@ -1,5 +1,5 @@
 import React, { useState } from "react";
-import { generateProject } from "./api";
+import { streamProject } from "./api";
 import ProjectPreview from "./components/ProjectPreview";
 import "./index.css";
 import "./App.css";
@@ -7,6 +7,8 @@ import "./App.css";
 export default function App() {
   const [description, setDescription] = useState("");
   const [projectId, setProjectId] = useState(null);
+  const [pages, setPages] = useState([]);
+  const [done, setDone] = useState(false);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
 
@@ -15,10 +17,16 @@ export default function App() {
     setLoading(true);
     setError("");
     setProjectId(null);
+    setPages([]);
+    setDone(false);
 
     try {
-      const result = await generateProject(description);
+      const result = await streamProject(description, (id, file) => {
+        setProjectId(id);
+        setPages((prev) => [...prev, file.path]);
+      });
       setProjectId(result.project_id);
+      setDone(true);
     } catch (err) {
       setError("⚠️ Error generating project. Check backend logs.");
       console.error(err);
@@ -49,7 +57,7 @@ export default function App() {
 
       <div className="right-panel">
         {projectId ? (
-          <ProjectPreview projectId={projectId} />
+          <ProjectPreview projectId={projectId} pages={pages} done={done} />
         ) : (
           <div className="placeholder">
             <p>💡 Your project preview will appear here once generated.</p>
@@ -2,13 +2,55 @@ import axios from "axios";
 
 const API_BASE = "http://127.0.0.1:8000";
 
-export const generateProject = async (description) => {
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Queues a generation job and polls /jobs/{id} until it finishes
+export const generateProject = async (description, { pollInterval = 1500 } = {}) => {
   const res = await axios.post(`${API_BASE}/generate/`, { description });
+  const jobId = res.data.job_id;
+  for (;;) {
+    const job = await getJob(jobId);
+    if (job.status === "succeeded") return job.result;
+    if (job.status === "failed" || job.status === "cancelled") {
+      throw new Error(job.error || `Generation ${job.status}`);
+    }
+    await sleep(pollInterval);
+  }
+};
+
+// Streams a generation over Server-Sent Events; onFile(projectId, { path, bytes })
+// fires as each page is written, so the preview can start before the site is done
+export const streamProject = async (description, onFile) => {
+  const res = await axios.post(`${API_BASE}/generate/`, { description, stream: true });
+  const { job_id: jobId, project_id: projectId } = res.data;
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(`${API_BASE}/jobs/${jobId}/events`);
+    source.addEventListener("file", (e) => onFile(projectId, JSON.parse(e.data)));
+    source.addEventListener("done", (e) => {
+      source.close();
+      const job = JSON.parse(e.data);
+      if (job.status === "succeeded") resolve(job.result);
+      else reject(new Error(job.error || `Generation ${job.status}`));
+    });
+    source.onerror = () => {
+      source.close();
+      reject(new Error("Lost connection to generation stream"));
+    };
+  });
+};
+
+export const getJob = async (jobId) => {
+  const res = await axios.get(`${API_BASE}/jobs/${jobId}`);
+  return res.data;
+};
+
+export const cancelJob = async (jobId) => {
+  const res = await axios.delete(`${API_BASE}/jobs/${jobId}`);
   return res.data;
 };
 
-export const getPreviewUrl = (projectId) => {
-  return `${API_BASE}/generated_projects/${projectId}/index_preview.html`;
+export const getPreviewUrl = (projectId, page = "index.html") => {
+  return `${API_BASE}/generated_projects/${projectId}/${page}`;
 };
 
 export const getDownloadUrl = (projectId) => {
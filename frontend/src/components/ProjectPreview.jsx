@@ -1,24 +1,37 @@
 import React from "react";
 import { getPreviewUrl, getDownloadUrl } from "../api";
 
-const ProjectPreview = ({ projectId }) => {
+const ProjectPreview = ({ projectId, pages = [], done = true }) => {
   if (!projectId) return null;
 
-  const previewUrl = getPreviewUrl(projectId);
+  // While streaming, show index.html as soon as it has been written
+  const previewUrl = done || pages.includes("index.html") ? getPreviewUrl(projectId) : null;
   const downloadUrl = getDownloadUrl(projectId);
 
   return (
     <div className="preview-container">
       <h2>🧩 Project ID: {projectId}</h2>
       <div className="preview-actions">
-        <a href={downloadUrl} target="_blank" rel="noopener noreferrer" className="btn btn-green">
-          📦 Download ZIP
-        </a>
-        <a href={previewUrl} target="_blank" rel="noopener noreferrer" className="btn btn-blue">
-          🔍 Open Preview
-        </a>
+        {done && (
+          <a href={downloadUrl} target="_blank" rel="noopener noreferrer" className="btn btn-green">
+            📦 Download ZIP
+          </a>
+        )}
+        {previewUrl && (
+          <a href={previewUrl} target="_blank" rel="noopener noreferrer" className="btn btn-blue">
+            🔍 Open Preview
+          </a>
+        )}
       </div>
-      <iframe title="Project Preview" src={previewUrl} className="preview-frame" />
+      {pages.length > 0 && (
+        <ul className="page-list">
+          {pages.map((page) => (
+            <li key={page}>✅ {page}</li>
+          ))}
+          {!done && <li className="page-pending">⏳ generating…</li>}
+        </ul>
+      )}
+      {previewUrl && <iframe title="Project Preview" src={previewUrl} className="preview-frame" />}
     </div>
   );
 };